@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class MemoryBackend:
+    """Per-process LRU store with a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {}
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Counters are kept apart from the LRU so a generation is never evicted.
+    def get_counter(self, key: str):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+class RedisBackend:
+    """Shared store for multi-process deployments; needs the optional `redis` package."""
+
+    def __init__(self, url: str):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str):
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._client.set(key, value, px=int(ttl * 1000))
+
+    def get_counter(self, key: str):
+        return int(self._client.get(key) or 0)
+
+    def incr(self, key: str):
+        self._client.incr(key)
+
+class CacheEntry:
+    def __init__(self, body: bytes, headers: dict):
+        self.body = body
+        self.headers = headers
+
+    @property
+    def etag(self):
+        return self.headers["ETag"]
+
+    def encode(self):
+        return json.dumps(self.headers).encode() + b"\n" + self.body
+
+    @classmethod
+    def decode(cls, value: bytes):
+        headers, body = value.split(b"\n", 1)
+        return cls(body, json.loads(headers))
+
+class ReadCache:
+    """Caches serialized read responses.
+
+    Each entry is filed under the data namespaces it was built from (e.g.
+    "students", "submissions:3"). Its key embeds the current generation of each
+    of them, so invalidate() makes old entries unreachable without scanning.
+    """
+
+    def __init__(self, backend, ttl: float = 60):
+        self.backend = backend
+        self.ttl = ttl
+
+    def key(self, endpoint: str, params, namespaces):
+        generations = ",".join(f"{ns}@{self.backend.get_counter('gen:' + ns)}" for ns in namespaces)
+        return f"read:{endpoint}?{'&'.join(sorted(f'{k}={v}' for k, v in params.items()))}|{generations}"
+
+    def get(self, key: str):
+        value = self.backend.get(key)
+        return CacheEntry.decode(value) if value is not None else None
+
+    def set(self, key: str, body: bytes, headers: dict | None = None):
+        etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        entry = CacheEntry(body, {**(headers or {}), "ETag": etag})
+        # A ttl of 0 turns the cache off; the entry still carries its ETag.
+        if self.ttl > 0:
+            self.backend.set(key, entry.encode(), self.ttl)
+        return entry
+
+    def invalidate(self, *namespaces: str):
+        for ns in namespaces:
+            self.backend.incr("gen:" + ns)
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one.
+
+    The first caller runs fn; callers arriving while it runs await the same
+    result or exception instead of repeating the work. Per process.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key: str, fn):
+        future = self._calls.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                return await fn()  # the first caller went away; do it ourselves
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()  # retrieved: no warning if nobody was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+def _default_backend():
+    if os.getenv("CACHE_URL"):
+        return RedisBackend(os.environ["CACHE_URL"])
+    return MemoryBackend(int(os.getenv("CACHE_MAX_ENTRIES", "1024")))
+
+read_cache = ReadCache(_default_backend(), float(os.getenv("CACHE_TTL", "60")))
+
+def configure(backend, ttl: float | None = None):
+    read_cache.backend = backend
+    if ttl is not None:
+        read_cache.ttl = ttl
+
+def invalidate(*namespaces: str):
+    read_cache.invalidate(*namespaces)
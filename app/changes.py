@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger("app.changes")
+
+CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", "1"))
+SUBSCRIBER_BACKLOG = 100
+
+class ChangeHub:
+    """Fans new change-log rows out to every change stream open in this process.
+
+    A single poller reads the log on behalf of all subscribers, so open
+    dashboards cost one query per interval instead of one each.
+    """
+
+    def __init__(self, fetch, latest, interval: float = CHANGES_POLL_INTERVAL, page_size: int = 1000):
+        self.fetch = fetch  # async (since, limit) -> {"cursor", "changes"}, or None if since was pruned
+        self.latest = latest  # async () -> newest change id
+        self.interval = interval
+        self.page_size = page_size
+        self.cursor = None
+        self._subscribers = set()
+        self._task = None
+
+    async def subscribe(self):
+        # Everything after self.cursor as of now reaches the returned queue as
+        # lists of changes; None means the subscriber fell behind and must resync.
+        if self.cursor is None:
+            self.cursor = await self.latest()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_BACKLOG)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+        if not self._subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.cursor = None
+
+    def _resync(self, queue):
+        # Drop the queue's backlog and tell its stream to resync.
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+        self._subscribers.discard(queue)
+
+    def _publish(self, changes):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(changes)
+            except asyncio.QueueFull:
+                self._resync(queue)  # a stalled client
+
+    async def _poll(self):
+        while self._subscribers:
+            try:
+                feed = await self.fetch(self.cursor, self.page_size)
+            except Exception:
+                logger.exception("change feed poll failed")
+                feed = {"cursor": self.cursor, "changes": []}
+            if feed is None:
+                for queue in list(self._subscribers):
+                    self._resync(queue)
+            elif feed["changes"]:
+                self.cursor = feed["cursor"]
+                self._publish(feed["changes"])
+                if len(feed["changes"]) == self.page_size:
+                    continue
+            await asyncio.sleep(self.interval)
+        self.cursor = None
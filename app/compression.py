@@ -0,0 +1,135 @@
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1000"))
+COMPRESSIBLE_TYPES = (
+    b"text/",
+    b"application/json",
+    b"application/x-ndjson",
+    b"application/javascript",
+    b"image/svg+xml",
+)
+
+def _accepted(header: str):
+    # Encodings the client accepts, with their q-values.
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    return accepted
+
+def choose_encoding(header: str):
+    accepted = _accepted(header)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=4)
+        else:
+            self._br = None
+            self._gzip = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool):
+        # Every chunk is flushed, so streamed NDJSON lines and change events
+        # still reach the client as they are produced.
+        if self._br is not None:
+            out = self._br.process(data) + (self._br.finish() if final else self._br.flush())
+        else:
+            out = self._gzip.compress(data) + self._gzip.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        return out
+
+class CompressionMiddleware:
+    """Compresses text responses with brotli or gzip, as the client accepts.
+
+    Complete bodies smaller than minimum_size are sent as they are. Streamed
+    bodies are compressed chunk by chunk. ETags become weak, since the bytes
+    differ from the uncompressed representation.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                response_start, start = start, None
+                if not self._should_compress(response_start, body, more_body):
+                    await send(response_start)
+                    compressor = False
+                    return await send(message)
+                compressor = _Compressor(encoding)
+                await send(self._compressed_start(response_start, encoding))
+            if compressor is False:
+                return await send(message)
+            await send({"type": "http.response.body", "body": compressor.compress(body, not more_body), "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _should_compress(self, start, body, more_body):
+        if start["status"] != 200:
+            return False
+        headers = dict(start.get("headers", []))
+        if b"content-encoding" in headers:
+            return False
+        if not headers.get(b"content-type", b"").startswith(COMPRESSIBLE_TYPES):
+            return False
+        if not more_body:
+            return len(body) >= self.minimum_size
+        length = headers.get(b"content-length")
+        return length is None or int(length) >= self.minimum_size
+
+    def _compressed_start(self, start, encoding):
+        headers = []
+        vary = False
+        for name, value in start.get("headers", []):
+            if name == b"content-length":
+                continue
+            if name == b"etag" and not value.startswith(b"W/"):
+                value = b"W/" + value
+            if name == b"vary":
+                vary = True
+                value += b", Accept-Encoding"
+            headers.append((name, value))
+        headers.append((b"content-encoding", encoding.encode()))
+        if not vary:
+            headers.append((b"vary", b"Accept-Encoding"))
+        return {**start, "headers": headers}
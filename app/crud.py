@@ -1,69 +1,534 @@
+import functools
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, func, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from . import models, schemas
+from . import cache, models, schemas
+
+BULK_CHUNK_SIZE = 1000
+
+def _replica_read(fn):
+    # Marks a read that database.RoutingSession may serve from a read replica.
+    @functools.wraps(fn)
+    def wrapper(db, *args, **kwargs):
+        db.info["replica_read"] = True
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.info["replica_read"] = False
+    return wrapper
+
+def _insert(db: Session, model):
+    # Dialect-specific INSERT so writes can use ON CONFLICT.
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def _chunks(items, size=BULK_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _adjust_counters(db: Session, model, key: str, count_column: str, counts: Counter, delta: int):
+    # Keys go in sorted order, so concurrent writers lock counter rows in the
+    # same order and cannot deadlock. Increments create missing rows (a
+    # missing row reads as 0); decrements leave missing rows alone rather than
+    # create them negative.
+    items = sorted(counts.items())
+    for chunk in _chunks(items):
+        if delta < 0:
+            key_column = getattr(model, key)
+            stmt = (
+                update(model)
+                .where(key_column.in_([k for k, _ in chunk]))
+                .values({count_column: getattr(model, count_column) + case(dict((k, n * delta) for k, n in chunk), value=key_column)})
+                .execution_options(synchronize_session=False)
+            )
+            db.execute(stmt)
+            continue
+        stmt = _insert(db, model).values([{key: k, count_column: n * delta} for k, n in chunk])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={count_column: getattr(model, count_column) + getattr(stmt.excluded, count_column)},
+        )
+        db.execute(stmt)
+
+def _adjust_summaries(db: Session, pairs, delta: int):
+    # Add delta to the counters of every (student_id, assignment_id) pair, in
+    # the caller's transaction.
+    _adjust_counters(db, models.StudentSummary, "student_id", "completed_count", Counter(s for s, _ in pairs), delta)
+    _adjust_counters(db, models.AssignmentSummary, "assignment_id", "submitted_count", Counter(a for _, a in pairs), delta)
+
+def _columns(model):
+    return model.__table__.columns
+
+def _select(db: Session, model, columns: bool = False):
+    # columns=True selects plain column tuples instead of ORM objects, for
+    # callers that serialize rows directly.
+    if columns:
+        return db.query(*_columns(model))
+    return db.query(model)
+
+# Every write appends its changed rows to the change log just before committing.
+# On PostgreSQL, concurrent writers can commit their change ids out of order, so
+# a reader that handed out the newest visible id could skip a lower id that
+# commits a moment later. Change rows are stamped with the database clock, and
+# readers only hand out changes older than CHANGES_VISIBILITY_LAG seconds, which
+# bounds how long an append may wait for its commit. SQLite already serializes
+# writers.
+CHANGES_VISIBILITY_LAG = float(os.getenv("CHANGES_VISIBILITY_LAG", "2"))
+
+def _db_utcnow():
+    return func.timezone("utc", func.clock_timestamp())
+
+def _payload(row):
+    data = row if isinstance(row, dict) else row._asdict()
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in data.items()}
+
+def _record_changes(db: Session, entity: str, op: str, rows):
+    rows = [{"entity": entity, "op": op, "data": _payload(row)} for row in rows]
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        for row in rows:
+            row["created_at"] = _db_utcnow()
+    for chunk in _chunks(rows):
+        db.execute(insert(models.Change).values(chunk))
+
+def _settled_changes(db: Session, query):
+    # Changes old enough that no lower id can still be waiting on its commit.
+    if db.get_bind().dialect.name == "postgresql":
+        return query.filter(models.Change.created_at < _db_utcnow() - timedelta(seconds=CHANGES_VISIBILITY_LAG))
+    return query
+
+# Single-row writes are one statement each, plus their change-log row, returning the affected row as a
+# column tuple; the unique constraints replace pre-check SELECTs.
 
 def create_assignment(db: Session, assignment: schemas.AssignmentCreate):
-    db_assignment = models.Assignment(**assignment.dict())
-    db.add(db_assignment)
+    stmt = insert(models.Assignment).values(**assignment.dict()).returning(*_columns(models.Assignment))
+    db_assignment = db.execute(stmt).first()
+    _record_changes(db, "assignment", "insert", [db_assignment])
     db.commit()
-    db.refresh(db_assignment)
+    cache.invalidate("assignments")
     return db_assignment
 
-def get_students_completed(db: Session, assignment_id: int):
-    return db.query(models.Student).join(models.Submission).filter(models.Submission.assignment_id == assignment_id).all()
+def _has_submitted(assignment_id: int):
+    # Correlated EXISTS: planned as a semi-join, or an anti-join when negated,
+    # probing the (assignment_id, student_id) index once per student.
+    return select(models.Submission.student_id).where(
+        models.Submission.assignment_id == assignment_id,
+        models.Submission.student_id == models.Student.id,
+    ).exists()
 
-def get_students_pending(db: Session, assignment_id: int):
-    submitted = db.query(models.Submission.student_id).filter(models.Submission.assignment_id == assignment_id)
-    return db.query(models.Student).filter(~models.Student.id.in_(submitted)).all()
+@_replica_read
+def get_students_completed(db: Session, assignment_id: int, limit: int | None = None, after: int | None = None, columns: bool = False):
+    query = _select(db, models.Student, columns).filter(_has_submitted(assignment_id))
+    return _keyset(query, models.Student, limit, after).all()
+
+@_replica_read
+def get_students_pending(db: Session, assignment_id: int, limit: int | None = None, after: int | None = None, columns: bool = False):
+    query = _select(db, models.Student, columns).filter(~_has_submitted(assignment_id))
+    return _keyset(query, models.Student, limit, after).all()
+
+@_replica_read
+def count_students_completed(db: Session, assignment_id: int):
+    return db.query(func.count(models.Student.id)).filter(_has_submitted(assignment_id)).scalar()
+
+@_replica_read
+def count_students_pending(db: Session, assignment_id: int):
+    return db.query(func.count(models.Student.id)).filter(~_has_submitted(assignment_id)).scalar()
 
 def update_student(db: Session, student_id: int, student_update: schemas.StudentUpdate):
-    student = db.query(models.Student).filter(models.Student.id == student_id).first()
+    changes = {var: value for var, value in vars(student_update).items() if value is not None}
+    if not changes:
+        return _select(db, models.Student, columns=True).filter(models.Student.id == student_id).first()
+    stmt = (
+        update(models.Student)
+        .where(models.Student.id == student_id)
+        .values(**changes)
+        .returning(*_columns(models.Student))
+    )
+    student = db.execute(stmt).first()
     if student:
-        for var, value in vars(student_update).items():
-            if value is not None:
-                setattr(student, var, value)
+        _record_changes(db, "student", "update", [student])
         db.commit()
-        db.refresh(student)
+        cache.invalidate("students")
     return student
 
+def _remove_submissions(db: Session, scope, ids):
+    # Set-based removal of every submission whose scope column (student_id or
+    # assignment_id) is in ids. The DELETE returns the other side's id of each
+    # removed row, and exactly those rows come off its counters, so a
+    # submission committed concurrently is either deleted and counted or kept.
+    # Returns the ids of the other side whose counters changed.
+    if scope is models.Submission.assignment_id:
+        other, summary, key, count = models.Submission.student_id, models.StudentSummary, "student_id", "completed_count"
+    else:
+        other, summary, key, count = models.Submission.assignment_id, models.AssignmentSummary, "assignment_id", "submitted_count"
+    removed = Counter(db.execute(
+        delete(models.Submission).where(scope.in_(ids)).returning(other).execution_options(synchronize_session=False)
+    ).scalars())
+    _adjust_counters(db, summary, key, count, removed, -1)
+    return sorted(removed)
+
+# Dependent rows are deleted explicitly rather than left to the ON DELETE
+# CASCADE foreign keys, so databases created before those keys, and SQLite
+# without PRAGMA foreign_keys, behave the same.
+
+def _delete_assignment_dependents(db: Session, ids):
+    _remove_submissions(db, models.Submission.assignment_id, ids)
+    db.execute(delete(models.AssignmentSummary).where(models.AssignmentSummary.assignment_id.in_(ids)))
+
+def _delete_student_dependents(db: Session, ids):
+    assignment_ids = _remove_submissions(db, models.Submission.student_id, ids)
+    db.execute(delete(models.StudentSummary).where(models.StudentSummary.student_id.in_(ids)))
+    return assignment_ids
+
 def delete_assignment(db: Session, assignment_id: int):
-    assignment = db.query(models.Assignment).filter(models.Assignment.id == assignment_id).first()
+    _delete_assignment_dependents(db, [assignment_id])
+    stmt = delete(models.Assignment).where(models.Assignment.id == assignment_id).returning(*_columns(models.Assignment))
+    assignment = db.execute(stmt).first()
     if assignment:
-        db.delete(assignment)
+        _record_changes(db, "assignment", "delete", [{"id": assignment_id}])
         db.commit()
+        cache.invalidate("assignments", "submissions", f"submissions:{assignment_id}")
     return assignment
 
 def create_student(db: Session, student: schemas.StudentCreate):
-    db_student = db.query(models.Student).filter(models.Student.email == student.email).first()
-    if db_student:
+    stmt = (
+        _insert(db, models.Student)
+        .values(name=student.name, email=student.email)
+        .on_conflict_do_nothing(index_elements=["email"])
+        .returning(*_columns(models.Student))
+    )
+    new_student = db.execute(stmt).first()
+    if new_student is None:
         return None  # Email already exists
-    new_student = models.Student(name=student.name, email=student.email)
-    db.add(new_student)
+    _record_changes(db, "student", "insert", [new_student])
     db.commit()
-    db.refresh(new_student)
+    cache.invalidate("students")
     return new_student
 
-def get_all_students(db: Session):
-    return db.query(models.Student).all()
+def _keyset(query, model, limit=None, after=None):
+    query = query.order_by(model.id)
+    if after is not None:
+        query = query.filter(model.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
 
-def get_all_assignments(db: Session):
-    return db.query(models.Assignment).all()
+def import_students(db: Session, students: list[schemas.StudentCreate]):
+    # Emails repeated within the batch count as duplicates, like existing ones.
+    rows = {student.email: {"name": student.name, "email": student.email} for student in students}
+    stmt = (
+        _insert(db, models.Student)
+        .values(list(rows.values()))
+        .on_conflict_do_nothing(index_elements=["email"])
+        .returning(*_columns(models.Student))
+    )
+    rows = db.execute(stmt).all()
+    _record_changes(db, "student", "insert", rows)
+    inserted = len(rows)
+    db.commit()
+    if inserted:
+        cache.invalidate("students")
+    return inserted
+
+@_replica_read
+def get_all_students(db: Session, limit: int | None = None, after: int | None = None, columns: bool = False):
+    return _keyset(_select(db, models.Student, columns), models.Student, limit, after).all()
+
+@_replica_read
+def get_all_assignments(db: Session, limit: int | None = None, after: int | None = None, columns: bool = False):
+    return _keyset(_select(db, models.Assignment, columns), models.Assignment, limit, after).all()
+
+@_replica_read
+def get_all_submissions(db: Session, limit: int | None = None, after: int | None = None, columns: bool = False):
+    return _keyset(_select(db, models.Submission, columns), models.Submission, limit, after).all()
 
-def get_all_submissions(db: Session):
-    return db.query(models.Submission).all()
+def keyset_select(model, after: int | None = None):
+    stmt = select(model).order_by(model.id)
+    if after is not None:
+        stmt = stmt.where(model.id > after)
+    return stmt
+
+def iter_rows(db: Session, model, after: int | None = None, batch_size: int = 1000):
+    return db.scalars(keyset_select(model, after).execution_options(yield_per=batch_size))
+
+def _submission_pair(student_id: int, assignment_id: int):
+    return (models.Submission.student_id == student_id) & (models.Submission.assignment_id == assignment_id)
 
 def create_submission(db: Session, student_id: int, assignment_id: int):
-    existing = db.query(models.Submission).filter_by(student_id=student_id, assignment_id=assignment_id).first()
-    if existing:
-        return existing
-    submission = models.Submission(student_id=student_id, assignment_id=assignment_id)
-    db.add(submission)
+    stmt = (
+        _insert(db, models.Submission)
+        .values(student_id=student_id, assignment_id=assignment_id)
+        .on_conflict_do_nothing(index_elements=["student_id", "assignment_id"])
+        .returning(*_columns(models.Submission))
+    )
+    submission = db.execute(stmt).first()
+    if submission is None:
+        # Already submitted: return the existing row, as before.
+        return _select(db, models.Submission, columns=True).filter(_submission_pair(student_id, assignment_id)).first()
+    _adjust_summaries(db, [(student_id, assignment_id)], 1)
+    _record_changes(db, "submission", "insert", [submission])
     db.commit()
-    db.refresh(submission)
+    cache.invalidate("submissions", f"submissions:{assignment_id}")
     return submission
 
 def delete_submission(db: Session, student_id: int, assignment_id: int):
-    submission = db.query(models.Submission).filter_by(student_id=student_id, assignment_id=assignment_id).first()
+    stmt = delete(models.Submission).where(_submission_pair(student_id, assignment_id)).returning(*_columns(models.Submission))
+    submission = db.execute(stmt).first()
     if submission:
-        db.delete(submission)
+        _adjust_summaries(db, [(student_id, assignment_id)], -1)
+        _record_changes(db, "submission", "delete", [submission])
         db.commit()
-    return submission
\ No newline at end of file
+        cache.invalidate("submissions", f"submissions:{assignment_id}")
+    return submission
+
+@_replica_read
+def get_submission_matrix(db: Session, limit: int | None = None, after: int | None = None):
+    # A page covers limit students after the given id; every page carries
+    # all the assignment headers.
+    students = _keyset(db.query(models.Student.id, models.Student.name, models.Student.email), models.Student, limit, after).all()
+    assignments = db.query(models.Assignment.id, models.Assignment.title).order_by(models.Assignment.id).all()
+    # One row per student that has submitted anything, with the submitted
+    # assignment ids aggregated in the database.
+    if db.get_bind().dialect.name == "postgresql":
+        submitted_ids = func.array_agg(models.Submission.assignment_id)
+    else:
+        submitted_ids = func.group_concat(models.Submission.assignment_id)
+    query = db.query(models.Submission.student_id, submitted_ids)
+    if limit is not None or after is not None:
+        if not students:
+            return {"students": [], "assignments": assignments, "submitted": []}
+        query = query.filter(models.Submission.student_id.between(students[0].id, students[-1].id))
+    rows = query.group_by(models.Submission.student_id).all()
+    by_student = {}
+    for student_id, ids in rows:
+        if isinstance(ids, str):
+            ids = [int(i) for i in ids.split(",")]
+        by_student[student_id] = sorted(ids)
+    return {
+        "students": students,
+        "assignments": assignments,
+        "submitted": [by_student.get(s.id, []) for s in students],
+    }
+
+def bulk_update_submissions(db: Session, ops: list[schemas.SubmissionOp]):
+    # The last op given for a (student, assignment) pair wins.
+    latest = {}
+    for op in ops:
+        latest[(op.student_id, op.assignment_id)] = op.op
+    adds = [pair for pair, op in latest.items() if op == "add"]
+    removes = [pair for pair, op in latest.items() if op == "remove"]
+    created_rows, deleted_rows = [], []
+    for chunk in _chunks(adds):
+        stmt = (
+            _insert(db, models.Submission)
+            .values([{"student_id": s, "assignment_id": a} for s, a in chunk])
+            .on_conflict_do_nothing(index_elements=["student_id", "assignment_id"])
+            .returning(*_columns(models.Submission))
+        )
+        created_rows.extend(db.execute(stmt))
+    for chunk in _chunks(removes):
+        stmt = (
+            delete(models.Submission)
+            .where(tuple_(models.Submission.student_id, models.Submission.assignment_id).in_(chunk))
+            .returning(*_columns(models.Submission))
+        )
+        deleted_rows.extend(db.execute(stmt))
+    created = {(row.student_id, row.assignment_id) for row in created_rows}
+    deleted = {(row.student_id, row.assignment_id) for row in deleted_rows}
+    _adjust_summaries(db, created, 1)
+    _adjust_summaries(db, deleted, -1)
+    _record_changes(db, "submission", "insert", created_rows)
+    _record_changes(db, "submission", "delete", deleted_rows)
+    db.commit()
+    changed = created | deleted
+    if changed:
+        cache.invalidate("submissions", *{f"submissions:{a}" for _, a in changed})
+    results = []
+    for (student_id, assignment_id), op in latest.items():
+        if op == "add":
+            status = "created" if (student_id, assignment_id) in created else "exists"
+        else:
+            status = "deleted" if (student_id, assignment_id) in deleted else "not_found"
+        results.append({"student_id": student_id, "assignment_id": assignment_id, "op": op, "status": status})
+    return results
+
+# New students and assignments get no summary row until their first
+# submission; the outer joins read a missing row as a count of 0.
+
+def _assignment_summaries(db: Session):
+    return db.query(
+        models.Assignment.id.label("assignment_id"),
+        func.coalesce(models.AssignmentSummary.submitted_count, 0).label("submitted_count"),
+    ).outerjoin(models.AssignmentSummary, models.AssignmentSummary.assignment_id == models.Assignment.id)
+
+def _student_summaries(db: Session):
+    return db.query(
+        models.Student.id.label("student_id"),
+        func.coalesce(models.StudentSummary.completed_count, 0).label("completed_count"),
+    ).outerjoin(models.StudentSummary, models.StudentSummary.student_id == models.Student.id)
+
+@_replica_read
+def get_assignment_summaries(db: Session):
+    return _assignment_summaries(db).order_by(models.Assignment.id).all()
+
+@_replica_read
+def get_assignment_summary(db: Session, assignment_id: int):
+    return _assignment_summaries(db).filter(models.Assignment.id == assignment_id).first()
+
+@_replica_read
+def get_student_summaries(db: Session):
+    return _student_summaries(db).order_by(models.Student.id).all()
+
+@_replica_read
+def get_student_summary(db: Session, student_id: int):
+    return _student_summaries(db).filter(models.Student.id == student_id).first()
+
+def rebuild_summaries(db: Session):
+    db.execute(delete(models.AssignmentSummary))
+    db.execute(delete(models.StudentSummary))
+    db.execute(insert(models.AssignmentSummary).from_select(
+        ["assignment_id", "submitted_count"],
+        select(models.Assignment.id, func.count(models.Submission.id))
+        .outerjoin(models.Submission, models.Submission.assignment_id == models.Assignment.id)
+        .group_by(models.Assignment.id),
+    ))
+    db.execute(insert(models.StudentSummary).from_select(
+        ["student_id", "completed_count"],
+        select(models.Student.id, func.count(models.Submission.id))
+        .outerjoin(models.Submission, models.Submission.student_id == models.Student.id)
+        .group_by(models.Student.id),
+    ))
+    db.commit()
+
+def delete_assignments(db: Session, ids: list[int]):
+    deleted = []
+    for chunk in _chunks(sorted(set(ids))):
+        _delete_assignment_dependents(db, chunk)
+        stmt = delete(models.Assignment).where(models.Assignment.id.in_(chunk)).returning(models.Assignment.id)
+        deleted.extend(assignment_id for assignment_id, in db.execute(stmt))
+    _record_changes(db, "assignment", "delete", [{"id": i} for i in deleted])
+    db.commit()
+    if deleted:
+        cache.invalidate("assignments", "submissions", *(f"submissions:{i}" for i in deleted))
+    return sorted(deleted)
+
+def delete_students(db: Session, ids: list[int]):
+    deleted, assignment_ids = [], set()
+    for chunk in _chunks(sorted(set(ids))):
+        assignment_ids.update(_delete_student_dependents(db, chunk))
+        stmt = delete(models.Student).where(models.Student.id.in_(chunk)).returning(models.Student.id)
+        deleted.extend(student_id for student_id, in db.execute(stmt))
+    _record_changes(db, "student", "delete", [{"id": i} for i in deleted])
+    db.commit()
+    if deleted:
+        cache.invalidate("students", "submissions", *(f"submissions:{i}" for i in assignment_ids))
+    return sorted(deleted)
+
+# Deleting a student or an assignment logs only that row; readers drop its
+# submissions with it.
+
+@_replica_read
+def latest_change_id(db: Session):
+    return _settled_changes(db, db.query(func.max(models.Change.id))).scalar() or 0
+
+def get_changes(db: Session, since: int = 0, limit: int | None = None):
+    # None when since is older than the oldest change kept: the caller has
+    # missed pruned changes and must reload in full.
+    oldest = db.query(func.min(models.Change.id)).scalar()
+    if oldest is not None and since < oldest - 1:
+        return None
+    changes = _keyset(_settled_changes(db, db.query(models.Change)), models.Change, limit, since).all()
+    return {"cursor": changes[-1].id if changes else since, "changes": changes}
+
+def prune_changes(db: Session, older_than: timedelta):
+    # The newest change is always kept so ids are never reused and
+    # get_changes can still tell a stale cursor from an empty log.
+    cutoff = datetime.utcnow() - older_than
+    newest = select(func.max(models.Change.id)).scalar_subquery()
+    result = db.execute(delete(models.Change).where(models.Change.created_at < cutoff, models.Change.id < newest))
+    db.commit()
+    return result.rowcount
+
+# Submission analytics, computed in the database per assignment.
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+def _time_bucket(db: Session, bucket: str, column):
+    # Start of the hour or day containing column.
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(bucket, column)
+    return func.strftime("%Y-%m-%dT%H:00:00" if bucket == "hour" else "%Y-%m-%dT00:00:00", column)
+
+def _seconds_between(db: Session, start, end):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.extract("epoch", end - start)
+    return (func.julianday(end) - func.julianday(start)) * 86400
+
+@_replica_read
+def get_assignment_ids(db: Session):
+    return db.execute(select(models.Assignment.id).order_by(models.Assignment.id)).scalars().all()
+
+@_replica_read
+def get_submission_analytics(db: Session, assignment_ids: list[int], bucket: str = "day"):
+    # Three grouped queries over the (assignment_id, submitted_at) index,
+    # whatever the number of submissions: totals, time buckets and lead-time
+    # percentiles (seconds submitted before the deadline; late is negative).
+    Submission, Assignment = models.Submission, models.Assignment
+    on_time = func.coalesce(func.sum(case((Submission.submitted_at <= Assignment.due_date, 1), else_=0)), 0)
+    totals = db.execute(
+        select(Assignment.id, Assignment.due_date, func.count(Submission.id), on_time)
+        .outerjoin(Submission, Submission.assignment_id == Assignment.id)
+        .where(Assignment.id.in_(assignment_ids))
+        .group_by(Assignment.id, Assignment.due_date)
+        .order_by(Assignment.id)
+    ).all()
+    start = _time_bucket(db, bucket, Submission.submitted_at).label("start")
+    buckets = {}
+    for assignment_id, bucket_start, count in db.execute(
+        select(Submission.assignment_id, start, func.count())
+        .where(Submission.assignment_id.in_(assignment_ids))
+        .group_by(Submission.assignment_id, start)
+        .order_by(Submission.assignment_id, start)
+    ):
+        if isinstance(bucket_start, str):
+            bucket_start = datetime.fromisoformat(bucket_start)
+        buckets.setdefault(assignment_id, []).append({"start": bucket_start, "count": count})
+    # Nearest-rank percentiles via cume_dist(), which both PostgreSQL and SQLite have.
+    lead = _seconds_between(db, Submission.submitted_at, Assignment.due_date)
+    ranked = (
+        select(
+            Submission.assignment_id,
+            lead.label("lead"),
+            func.cume_dist().over(partition_by=Submission.assignment_id, order_by=lead).label("rank"),
+        )
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .where(Submission.assignment_id.in_(assignment_ids))
+        .subquery()
+    )
+    percentiles = {
+        assignment_id: values
+        for assignment_id, *values in db.execute(
+            select(ranked.c.assignment_id, *(func.min(case((ranked.c.rank >= p, ranked.c.lead))) for p in PERCENTILES))
+            .group_by(ranked.c.assignment_id)
+        )
+    }
+    return [
+        {
+            "assignment_id": assignment_id,
+            "due_date": due_date,
+            "total": total,
+            "on_time": submitted_on_time,
+            "late": total - submitted_on_time,
+            "buckets": buckets.get(assignment_id, []),
+            "lead_time_hours": {
+                f"p{round(p * 100)}": None if value is None else float(value) / 3600
+                for p, value in zip(PERCENTILES, percentiles.get(assignment_id, [None] * len(PERCENTILES)))
+            },
+        }
+        for assignment_id, due_date, total, submitted_on_time in totals
+    ]
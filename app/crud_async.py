@@ -0,0 +1,46 @@
+import functools
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from . import crud
+
+def _awaitable(fn):
+    # Run a crud function without blocking the event loop: in the threadpool
+    # on a sync Session, or through the greenlet bridge on an AsyncSession.
+    @functools.wraps(fn)
+    async def wrapper(db, *args, **kwargs):
+        if isinstance(db, Session):
+            return await run_in_threadpool(fn, db, *args, **kwargs)
+        return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+create_assignment = _awaitable(crud.create_assignment)
+get_students_completed = _awaitable(crud.get_students_completed)
+get_students_pending = _awaitable(crud.get_students_pending)
+count_students_completed = _awaitable(crud.count_students_completed)
+count_students_pending = _awaitable(crud.count_students_pending)
+update_student = _awaitable(crud.update_student)
+delete_assignment = _awaitable(crud.delete_assignment)
+delete_assignments = _awaitable(crud.delete_assignments)
+delete_students = _awaitable(crud.delete_students)
+create_student = _awaitable(crud.create_student)
+import_students = _awaitable(crud.import_students)
+get_all_students = _awaitable(crud.get_all_students)
+get_all_assignments = _awaitable(crud.get_all_assignments)
+get_all_submissions = _awaitable(crud.get_all_submissions)
+create_submission = _awaitable(crud.create_submission)
+delete_submission = _awaitable(crud.delete_submission)
+get_submission_matrix = _awaitable(crud.get_submission_matrix)
+bulk_update_submissions = _awaitable(crud.bulk_update_submissions)
+get_assignment_summaries = _awaitable(crud.get_assignment_summaries)
+get_assignment_summary = _awaitable(crud.get_assignment_summary)
+get_student_summaries = _awaitable(crud.get_student_summaries)
+get_student_summary = _awaitable(crud.get_student_summary)
+latest_change_id = _awaitable(crud.latest_change_id)
+get_changes = _awaitable(crud.get_changes)
+get_assignment_ids = _awaitable(crud.get_assignment_ids)
+get_submission_analytics = _awaitable(crud.get_submission_analytics)
+
+async def stream_rows(db, model, after: int | None = None, batch_size: int = 1000):
+    result = await db.stream_scalars(crud.keyset_select(model, after).execution_options(yield_per=batch_size))
+    async for row in result:
+        yield row
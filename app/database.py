@@ -1,14 +1,227 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import random
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from dotenv import load_dotenv
+from .instrumentation import instrument_engine
+from .metrics import Histogram
 
-load_dotenv()  # take environment variables from .env.
+# Set DB_ASYNC=1 to serve requests from the async engine instead of the sync one.
+USE_ASYNC_DB = os.getenv("DB_ASYNC", "0") == "1"
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is not set.")
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+def async_url(url: str):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+# Comma-separated read replicas for the reads crud marks as replica-safe.
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# How long a client's reads stay on the primary after it writes.
+PRIMARY_AFTER_WRITE_SECONDS = int(os.getenv("DB_PRIMARY_AFTER_WRITE", "5"))
+
+# The connection settings below are read by _load_settings when the first
+# engine is created, after loading .env, so importing the app reads no files.
+DATABASE_URL = ASYNC_DATABASE_URL = None
+POOL_SIZE = POOL_MAX_OVERFLOW = POOL_TIMEOUT = POOL_RECYCLE = POOL_PRE_PING = None
+
+def _load_settings():
+    global DATABASE_URL, ASYNC_DATABASE_URL, POOL_SIZE, POOL_MAX_OVERFLOW, POOL_TIMEOUT, POOL_RECYCLE, POOL_PRE_PING
+    load_dotenv()  # take environment variables from .env.
+    DATABASE_URL = os.getenv("DATABASE_URL")
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or (async_url(DATABASE_URL) if DATABASE_URL else None)
+    # Connection pool settings, applied to both the sync and the async engine.
+    POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    POOL_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+    POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+
+class PoolStats:
+    def __init__(self):
+        self.checkout_ms = Histogram()
+        self.timeouts = 0
+
+    def snapshot(self, pool):
+        stats = {"checkout_ms": self.checkout_ms.snapshot(), "timeouts": self.timeouts}
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), in_use=pool.checkedout(), overflow=max(pool.overflow(), 0))
+        return stats
+
+class _InstrumentedPoolMixin:
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.checkout_ms.observe((time.perf_counter() - start) * 1000)
+
+POOL_STATS = {"sync": PoolStats(), "async": PoolStats(), "replica": PoolStats(), "async_replica": PoolStats()}
+
+def engine_options(url, name: str):
+    url = make_url(url)
+    options = {"pool_pre_ping": POOL_PRE_PING, "pool_recycle": POOL_RECYCLE}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory SQLite keeps its single shared connection pool.
+        return options
+    base = AsyncAdaptedQueuePool if name.startswith("async") else QueuePool
+    options["poolclass"] = type(f"Instrumented{base.__name__}", (_InstrumentedPoolMixin, base), {"stats": POOL_STATS[name]})
+    options.update(pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
+    return options
+
+# Set while serving a client that wrote recently, so it reads its own writes.
+primary_only = ContextVar("primary_only", default=False)
+
+class RoutingSession(Session):
+    """Session that serves replica-safe reads from a read replica.
+
+    crud marks those reads with info["replica_read"]. Every other statement,
+    every read after the session has written, and every read while
+    primary_only is set go to the primary. A session sticks to one replica.
+    """
+
+    primary = None
+    replicas = ()
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or (clause is not None and clause.is_dml):
+            self.info["wrote"] = True
+        elif self.replicas and self.info.get("replica_read") and not self.info.get("wrote") and not primary_only.get():
+            if "replica" not in self.info:
+                self.info["replica"] = random.choice(self.replicas)
+            return self.info["replica"]
+        return self.primary
+
+def routing_session(primary, replicas=()):
+    return type("RoutingSession", (RoutingSession,), {"primary": primary, "replicas": tuple(replicas)})
+
+Base = declarative_base()
+
+# engine, replica_engines and SessionLocal are created on first access, so
+# importing the app loads no database driver and needs no DATABASE_URL.
+_LAZY = ("engine", "replica_engines", "SessionLocal")
+_lazy_lock = threading.Lock()
+
+def _lazy(name: str):
+    with _lazy_lock:
+        if name not in globals():
+            _create_engines()
+    return globals()[name]
+
+def __getattr__(name):
+    if name in _LAZY:
+        return _lazy(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _create_engines():
+    _load_settings()
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL environment variable is not set.")
+    primary = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, "sync"))
+    instrument_engine(primary)
+    replicas = [create_engine(url, **engine_options(url, "replica")) for url in REPLICA_URLS]
+    for replica in replicas:
+        instrument_engine(replica)
+    globals().update(
+        engine=primary,
+        replica_engines=replicas,
+        SessionLocal=sessionmaker(class_=routing_session(primary, replicas), autocommit=False, autoflush=False, bind=primary),
+    )
+
+async_engine = None
+async_replica_engines = []
+_async_sessionmaker = None
+
+def get_async_sessionmaker():
+    # Built on first use so the async driver is only required when it is selected.
+    global async_engine, async_replica_engines, _async_sessionmaker
+    if _async_sessionmaker is None:
+        _load_settings()
+        if not ASYNC_DATABASE_URL:
+            raise ValueError("DATABASE_URL environment variable is not set.")
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, "async"))
+        async_replica_engines = [create_async_engine(async_url(url), **engine_options(async_url(url), "async_replica")) for url in REPLICA_URLS]
+        for e in [async_engine, *async_replica_engines]:
+            instrument_engine(e.sync_engine)
+        session_class = routing_session(async_engine.sync_engine, [e.sync_engine for e in async_replica_engines])
+        _async_sessionmaker = async_sessionmaker(async_engine, sync_session_class=session_class, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
+
+def get_db():
+    db = _lazy("SessionLocal")()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+# Request handlers depend on get_session and work with either session type.
+get_session = get_async_db if USE_ASYNC_DB else get_db
+
+async def dispose_engines():
+    # Closes pooled connections at shutdown; engines never created are skipped.
+    for e in [globals().get("engine"), *globals().get("replica_engines", [])]:
+        if e is not None:
+            e.dispose()
+    for e in [async_engine, *async_replica_engines]:
+        if e is not None:
+            await e.dispose()
+
+def pool_metrics():
+    metrics = {}
+    # Under DB_ASYNC the sync engine serves no requests; do not create it here.
+    if not USE_ASYNC_DB or "engine" in globals():
+        metrics["sync"] = POOL_STATS["sync"].snapshot(_lazy("engine").pool)
+    if async_engine is not None:
+        metrics["async"] = POOL_STATS["async"].snapshot(async_engine.pool)
+    # Replicas share one set of checkout stats; size/in_use are per replica.
+    if REPLICA_URLS:
+        metrics["replicas"] = [POOL_STATS["replica"].snapshot(e.pool) for e in _lazy("replica_engines")]
+    if async_replica_engines:
+        metrics["async_replicas"] = [POOL_STATS["async_replica"].snapshot(e.pool) for e in async_replica_engines]
+    return metrics
+
+class PrimaryAfterWriteMiddleware:
+    """Keeps a client's reads on the primary for a while after it writes.
+
+    A successful write request gets a short-lived cookie back; requests that
+    carry it run with primary_only set, so replica lag never hides the
+    client's own changes. A no-op without replicas.
+    """
+
+    cookie = b"db_primary"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not REPLICA_URLS:
+            return await self.app(scope, receive, send)
+        cookies = b"; ".join(value for name, value in scope["headers"] if name == b"cookie")
+        token = primary_only.set(any(part.strip().startswith(self.cookie + b"=") for part in cookies.split(b";")))
+        writes = scope["method"] not in ("GET", "HEAD", "OPTIONS")
+
+        async def send_with_cookie(message):
+            if writes and message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = self.cookie + f"=1; Max-Age={PRIMARY_AFTER_WRITE_SECONDS}; Path=/; HttpOnly; SameSite=Lax".encode()
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            primary_only.reset(token)
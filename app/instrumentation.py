@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from sqlalchemy import event
+from .metrics import Histogram
+
+logger = logging.getLogger("app.sql")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_MAX_CHARS = 500
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+ROW_COUNT_BUCKETS = (0, 10, 100, 1000, 10000, 100000)
+
+class RequestStats:
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_ms = 0.0
+        self.rows = 0
+
+    @property
+    def route(self):
+        # The router fills in scope["route"] once it has matched the request.
+        route = getattr(self.scope.get("route"), "path", None) or "unmatched"
+        return f"{self.scope['method']} {route}"
+
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+def current_stats():
+    return _current.get()
+
+def add_rows(n: int):
+    stats = _current.get()
+    if stats is not None:
+        stats.rows += n
+
+# --- SQLAlchemy engine hooks ---
+
+slow_queries = deque(maxlen=50)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_ms += ms
+    if ms >= SLOW_QUERY_MS:
+        route = stats.route if stats is not None else None
+        statement = _loggable(statement, context)
+        slow_queries.append({"ms": round(ms, 3), "route": route, "statement": statement})
+        logger.warning("slow query (%.1f ms) on %s: %s", ms, route, statement)
+
+def _loggable(statement, context):
+    # The compiled SQL keeps bind placeholders where the executed statement
+    # may have had values rendered in, so student data never reaches the log.
+    compiled = getattr(context, "compiled", None)
+    if compiled is not None:
+        statement = compiled.string
+    if len(statement) > SLOW_QUERY_MAX_CHARS:
+        statement = statement[:SLOW_QUERY_MAX_CHARS] + "..."
+    return statement
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute.
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+# --- Per-route aggregates ---
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency_ms = Histogram()
+        self.db_ms = Histogram()
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.rows = Histogram(ROW_COUNT_BUCKETS)
+
+    def snapshot(self):
+        return {
+            "latency_ms": self.latency_ms.snapshot(),
+            "db_ms": self.db_ms.snapshot(),
+            "queries": self.queries.snapshot(),
+            "rows_serialized": self.rows.snapshot(),
+        }
+
+_routes = {}
+_routes_lock = threading.Lock()
+
+def _route_metrics(route: str):
+    with _routes_lock:
+        if route not in _routes:
+            _routes[route] = RouteMetrics()
+        return _routes[route]
+
+def route_metrics():
+    with _routes_lock:
+        routes = dict(_routes)
+    return {route: metrics.snapshot() for route, metrics in sorted(routes.items())}
+
+class InstrumentationMiddleware:
+    """Counts SQL statements, database time and serialized rows per request.
+
+    The totals at the time the response starts are sent in a Server-Timing
+    header; the final ones (including work done while streaming the body) go
+    into the per-route histograms.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - start) * 1000
+                timing = (
+                    f'db;dur={stats.db_ms:.1f};desc="{stats.queries} queries", '
+                    f'rows;desc="{stats.rows}", total;dur={total_ms:.1f}'
+                )
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            metrics = _route_metrics(stats.route)
+            metrics.latency_ms.observe((time.perf_counter() - start) * 1000)
+            metrics.db_ms.observe(stats.db_ms)
+            metrics.queries.observe(stats.queries)
+            metrics.rows.observe(stats.rows)
@@ -1,73 +1,419 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from email.utils import formatdate, parsedate_to_datetime
+import orjson
+from typing import Literal
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from fastapi.staticfiles import StaticFiles
-from . import models, schemas, crud
-from .database import SessionLocal, engine, Base
+from . import cache, changes, compression, models, schemas, crud, crud_async, database, instrumentation, ratelimit, roster
+from .database import get_db, get_session
+from .static_assets import AssetStaticFiles
 
-Base.metadata.create_all(bind=engine)
+# Set DB_CREATE_SCHEMA=0 where the schema is managed by
+# `python -m app.manage init-db` at deploy time, so workers start without
+# inspecting it.
+CREATE_SCHEMA = os.getenv("DB_CREATE_SCHEMA", "1") == "1"
 
-app = FastAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@asynccontextmanager
+async def lifespan(app):
+    if CREATE_SCHEMA:
+        await run_in_threadpool(models.create_schema, database.engine)
+        if database.USE_ASYNC_DB:
+            # Requests use the async engine: close the connection schema setup
+            # left in the sync pool, so a worker holds only its budgeted pool.
+            database.engine.dispose()
+    yield
+    await database.dispose_engines()
 
-def get_db():
-    db = SessionLocal()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(instrumentation.InstrumentationMiddleware)
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(database.PrimaryAfterWriteMiddleware)
+app.mount("/static", AssetStaticFiles(directory="static"), name="static")
+
+MAX_PAGE_SIZE = 1000
+
+coalescer = cache.SingleFlight()
+
+# Per-client limits on the hot read routes: (requests per second, burst).
+# Scale them all with RATE_LIMIT_SCALE, or set it to 0 to turn them off.
+RATE_LIMITS = {
+    "status": (10, 40),
+    "list": (10, 40),
+    "matrix": (5, 20),
+    "changes": (5, 20),
+    "analytics": (2, 10),
+    # Keyset continuation pages (after=...&limit=...) of the paged lists, shared
+    # per client, so the dashboard can load a large class in one go.
+    "pages": (20, 400),
+}
+
+def _limited(name, paged: bool = False):
+    return [Depends(ratelimit.rate_limit(*RATE_LIMITS[name], paged=RATE_LIMITS["pages"] if paged else None))]
+
+# List reads select plain column tuples and encode them with orjson, skipping
+# per-row Pydantic validation. Set FAST_JSON=0 to go through the schemas instead.
+FAST_JSON = os.getenv("FAST_JSON", "1") == "1"
+
+def _next_cursor(rows, limit):
+    # A full page means there may be more rows after the last id returned.
+    if limit is not None and len(rows) == limit:
+        return {"X-Next-Cursor": str(rows[-1].id)}
+    return {}
+
+def _dump(schema, row):
+    return schema(**{field: getattr(row, field) for field in schema.__fields__})
+
+def _json_line(schema, row):
+    instrumentation.add_rows(1)
+    return _dump(schema, row).json() + "\n"
+
+def _json_body(content):
+    return json.dumps(jsonable_encoder(content), separators=(",", ":")).encode()
+
+def _rows_body(schema, rows, columns: bool):
+    instrumentation.add_rows(len(rows))
+    if columns:
+        return orjson.dumps([row._asdict() for row in rows])
+    return _json_body([_dump(schema, row) for row in rows])
+
+def _etag_matches(request: Request, etag: str):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+def _not_modified_since(request: Request, last_modified: str | None):
+    # If-Modified-Since only counts when the client sent no If-None-Match.
+    header = request.headers.get("if-modified-since")
+    if not header or not last_modified or "if-none-match" in request.headers:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+
+async def _cached(request: Request, namespaces, build):
+    # Serve a read from the cache, building and storing its JSON body on a miss.
+    key = cache.read_cache.key(request.url.path, request.query_params, namespaces)
+    # A client reading its own writes skips entries a lagging replica may
+    # have filled, and refreshes them from the primary.
+    primary_only = database.primary_only.get()
+    entry = None if primary_only else cache.read_cache.get(key)
+    if entry is None:
+        async def fill():
+            body, headers = await build()
+            return cache.read_cache.set(key, body, {**headers, "Last-Modified": _http_now()})
+        # Concurrent misses on one key share a single query and serialization.
+        entry = await fill() if primary_only else await coalescer.do(key, fill)
+    return _entry_response(request, entry)
+
+def _http_now():
+    return formatdate(time.time(), usegmt=True)
+
+def _entry_response(request: Request, entry):
+    if _etag_matches(request, entry.etag) or _not_modified_since(request, entry.headers.get("Last-Modified")):
+        return Response(status_code=304, headers={name: value for name, value in entry.headers.items() if name in ("ETag", "Last-Modified")})
+    return Response(entry.body, media_type="application/json", headers=entry.headers)
+
+async def _cached_rows(request: Request, namespaces, schema, fetch, limit=None):
+    # fetch(columns) returns column tuples when columns is true, ORM objects otherwise.
+    async def build():
+        columns = FAST_JSON
+        rows = await fetch(columns)
+        return _rows_body(schema, rows, columns), _next_cursor(rows, limit)
+    return await _cached(request, namespaces, build)
+
+async def _cached_count(request: Request, namespaces, fetch):
+    async def build():
+        return _json_body({"count": await fetch()}), {}
+    return await _cached(request, namespaces, build)
+
+# The streaming body outlives the request-scoped session, so it opens its own.
+def _ndjson(model, schema, after):
+    db = database.SessionLocal()
+    try:
+        for row in crud.iter_rows(db, model, after):
+            yield _json_line(schema, row)
+    finally:
+        db.close()
+
+async def _ndjson_async(model, schema, after):
+    async with database.get_async_sessionmaker()() as db:
+        async for row in crud_async.stream_rows(db, model, after):
+            yield _json_line(schema, row)
+
+def _stream(model, schema, after):
+    body = _ndjson_async(model, schema, after) if database.USE_ASYNC_DB else _ndjson(model, schema, after)
+    return StreamingResponse(body, media_type="application/x-ndjson")
+
+async def _with_session(fn, *args):
+    # For work that runs outside a request, such as the change feed poller.
+    if database.USE_ASYNC_DB:
+        async with database.get_async_sessionmaker()() as db:
+            return await fn(db, *args)
+    db = database.SessionLocal()
     try:
-        yield db
+        return await fn(db, *args)
     finally:
         db.close()
 
+CHANGES_KEEPALIVE = 15
+
+change_hub = changes.ChangeHub(
+    lambda since, limit: _with_session(crud_async.get_changes, since, limit),
+    lambda: _with_session(crud_async.latest_change_id),
+    page_size=MAX_PAGE_SIZE,
+)
+
+def _change_event(cursor, rows):
+    data = orjson.dumps([_dump(schemas.Change, row).dict() for row in rows])
+    return f"id: {cursor}\nevent: changes\ndata: {data.decode()}\n\n"
+
+async def _change_events(since: int):
+    # Backfill from since, then follow the hub; the event id is the cursor a
+    # reconnecting EventSource sends back as Last-Event-ID.
+    queue = await change_hub.subscribe()
+    try:
+        while True:
+            feed = await _with_session(crud_async.get_changes, since, MAX_PAGE_SIZE)
+            if feed is None:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            if feed["changes"]:
+                since = feed["cursor"]
+                yield _change_event(since, feed["changes"])
+            if len(feed["changes"]) < MAX_PAGE_SIZE:
+                break
+        while True:
+            try:
+                rows = await asyncio.wait_for(queue.get(), CHANGES_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if rows is None:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            rows = [row for row in rows if row.id > since]
+            if rows:
+                since = rows[-1].id
+                yield _change_event(since, rows)
+    finally:
+        change_hub.unsubscribe(queue)
+
 @app.post("/assignments/", response_model=schemas.Assignment)
-def create_assignment(assignment: schemas.AssignmentCreate, db: Session = Depends(get_db)):
-    return crud.create_assignment(db, assignment)
+async def create_assignment(assignment: schemas.AssignmentCreate, db: Session = Depends(get_session)):
+    return await crud_async.create_assignment(db, assignment)
 
-@app.get("/students/completed/{assignment_id}", response_model=list[schemas.Student])
-def students_completed(assignment_id: int, db: Session = Depends(get_db)):
-    return crud.get_students_completed(db, assignment_id)
+@app.get("/students/completed/{assignment_id}", response_model=list[schemas.Student], dependencies=_limited("status", paged=True))
+async def students_completed(assignment_id: int, request: Request, limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), after: int | None = None, count_only: bool = False, db: Session = Depends(get_session)):
+    namespaces = ["students", f"submissions:{assignment_id}"]
+    if count_only:
+        return await _cached_count(request, namespaces, lambda: crud_async.count_students_completed(db, assignment_id))
+    return await _cached_rows(request, namespaces, schemas.Student, lambda columns: crud_async.get_students_completed(db, assignment_id, limit, after, columns=columns), limit)
 
-@app.get("/students/pending/{assignment_id}", response_model=list[schemas.Student])
-def students_pending(assignment_id: int, db: Session = Depends(get_db)):
-    return crud.get_students_pending(db, assignment_id)
+@app.get("/students/pending/{assignment_id}", response_model=list[schemas.Student], dependencies=_limited("status", paged=True))
+async def students_pending(assignment_id: int, request: Request, limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), after: int | None = None, count_only: bool = False, db: Session = Depends(get_session)):
+    namespaces = ["students", f"submissions:{assignment_id}"]
+    if count_only:
+        return await _cached_count(request, namespaces, lambda: crud_async.count_students_pending(db, assignment_id))
+    return await _cached_rows(request, namespaces, schemas.Student, lambda columns: crud_async.get_students_pending(db, assignment_id, limit, after, columns=columns), limit)
 
 @app.put("/students/{student_id}", response_model=schemas.Student)
-def update_student(student_id: int, student: schemas.StudentUpdate, db: Session = Depends(get_db)):
-    db_student = crud.update_student(db, student_id, student)
+async def update_student(student_id: int, student: schemas.StudentUpdate, db: Session = Depends(get_session)):
+    db_student = await crud_async.update_student(db, student_id, student)
     if not db_student:
         raise HTTPException(status_code=404, detail="Student not found")
     return db_student
 
 @app.delete("/assignments/{assignment_id}")
-def delete_assignment(assignment_id: int, db: Session = Depends(get_db)):
-    assignment = crud.delete_assignment(db, assignment_id)
+async def delete_assignment(assignment_id: int, db: Session = Depends(get_session)):
+    assignment = await crud_async.delete_assignment(db, assignment_id)
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
     return {"ok": True}
 
+@app.post("/assignments/bulk-delete", response_model=schemas.BulkDeleteResult)
+async def delete_assignments(request: schemas.BulkDelete, db: Session = Depends(get_session)):
+    return {"deleted": await crud_async.delete_assignments(db, request.ids)}
+
+@app.post("/students/bulk-delete", response_model=schemas.BulkDeleteResult)
+async def delete_students(request: schemas.BulkDelete, db: Session = Depends(get_session)):
+    return {"deleted": await crud_async.delete_students(db, request.ids)}
+
 @app.post("/students/", response_model=schemas.Student)
-def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)):
-    db_student = crud.create_student(db, student)
+async def create_student(student: schemas.StudentCreate, db: Session = Depends(get_session)):
+    db_student = await crud_async.create_student(db, student)
     if db_student is None:
         raise HTTPException(status_code=400, detail="Email already registered")
     return db_student
 
-@app.get("/students/", response_model=list[schemas.Student])
-def list_students(db: Session = Depends(get_db)):
-    return crud.get_all_students(db)
+@app.post("/students/import", response_model=schemas.ImportResult)
+async def import_students(request: Request, db: Session = Depends(get_session)):
+    # The body is parsed as it arrives and inserted one chunk at a time.
+    fmt = "ndjson" if "ndjson" in request.headers.get("content-type", "") else "csv"
+    result = {"inserted": 0, "duplicates": 0, "invalid": 0}
+    batch = []
+
+    async def flush():
+        inserted = await crud_async.import_students(db, batch)
+        result["inserted"] += inserted
+        result["duplicates"] += len(batch) - inserted
+        batch.clear()
+
+    async for row in roster.iter_rows(request.stream(), fmt):
+        try:
+            batch.append(schemas.StudentCreate(**row))
+        except (TypeError, ValidationError):
+            result["invalid"] += 1
+            continue
+        if len(batch) >= crud.BULK_CHUNK_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    return result
 
-@app.get("/assignments/", response_model=list[schemas.Assignment])
-def list_assignments(db: Session = Depends(get_db)):
-    return crud.get_all_assignments(db)
+@app.get("/students/", response_model=list[schemas.Student], dependencies=_limited("list", paged=True))
+async def list_students(request: Request, limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), after: int | None = None, stream: bool = False, db: Session = Depends(get_session)):
+    if stream:
+        return _stream(models.Student, schemas.Student, after)
+    return await _cached_rows(request, ["students"], schemas.Student, lambda columns: crud_async.get_all_students(db, limit, after, columns=columns), limit)
 
-@app.get("/submissions/", response_model=list[schemas.Submission])
-def list_submissions(db: Session = Depends(get_db)):
-    return crud.get_all_submissions(db)
+@app.get("/assignments/", response_model=list[schemas.Assignment], dependencies=_limited("list", paged=True))
+async def list_assignments(request: Request, limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), after: int | None = None, stream: bool = False, db: Session = Depends(get_session)):
+    if stream:
+        return _stream(models.Assignment, schemas.Assignment, after)
+    return await _cached_rows(request, ["assignments"], schemas.Assignment, lambda columns: crud_async.get_all_assignments(db, limit, after, columns=columns), limit)
 
-@app.post("/submissions/")
-def create_submission(student_id: int, assignment_id: int, db: Session = Depends(get_db)):
-    return crud.create_submission(db, student_id, assignment_id)
+@app.get("/submissions/", response_model=list[schemas.Submission], dependencies=_limited("list", paged=True))
+async def list_submissions(request: Request, limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), after: int | None = None, stream: bool = False, db: Session = Depends(get_session)):
+    if stream:
+        return _stream(models.Submission, schemas.Submission, after)
+    return await _cached_rows(request, ["submissions"], schemas.Submission, lambda columns: crud_async.get_all_submissions(db, limit, after, columns=columns), limit)
+
+@app.post("/submissions/", response_model=schemas.Submission)
+async def create_submission(student_id: int, assignment_id: int, db: Session = Depends(get_session)):
+    submission = await crud_async.create_submission(db, student_id, assignment_id)
+    if not submission:
+        # The conflicting row was deleted before it could be read back.
+        raise HTTPException(status_code=409, detail="Submission changed concurrently, retry")
+    return submission
+
+@app.post("/submissions/bulk", response_model=list[schemas.SubmissionOpResult])
+async def bulk_update_submissions(ops: list[schemas.SubmissionOp], db: Session = Depends(get_session)):
+    return await crud_async.bulk_update_submissions(db, ops)
 
 @app.delete("/submissions/")
-def delete_submission(student_id: int, assignment_id: int, db: Session = Depends(get_db)):
-    deleted = crud.delete_submission(db, student_id, assignment_id)
+async def delete_submission(student_id: int, assignment_id: int, db: Session = Depends(get_session)):
+    deleted = await crud_async.delete_submission(db, student_id, assignment_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Submission not found")
-    return {"ok": True}
\ No newline at end of file
+    return {"ok": True}
+
+@app.get("/matrix", response_model=schemas.Matrix, dependencies=_limited("matrix", paged=True))
+async def submission_matrix(response: Response, limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), after: int | None = None, db: Session = Depends(get_session)):
+    # The cursor is read first: changes racing the read are replayed by
+    # /changes, and replaying one is harmless.
+    response.headers["X-Change-Cursor"] = str(await crud_async.latest_change_id(db))
+    matrix = await crud_async.get_submission_matrix(db, limit, after)
+    instrumentation.add_rows(len(matrix["students"]))
+    return matrix
+
+@app.get("/changes", response_model=schemas.ChangeFeed, dependencies=_limited("changes"))
+async def list_changes(since: int = 0, limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db: Session = Depends(get_session)):
+    feed = await crud_async.get_changes(db, since, limit)
+    if feed is None:
+        raise HTTPException(status_code=410, detail="Cursor is older than the retained changes; reload")
+    instrumentation.add_rows(len(feed["changes"]))
+    return feed
+
+@app.get("/changes/stream", dependencies=_limited("changes"))
+async def stream_changes(request: Request, since: int = 0):
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(_change_events(since), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/summary/assignments", response_model=list[schemas.AssignmentSummary])
+async def assignment_summaries(db: Session = Depends(get_session)):
+    summaries = await crud_async.get_assignment_summaries(db)
+    instrumentation.add_rows(len(summaries))
+    return summaries
+
+@app.get("/summary/assignments/{assignment_id}", response_model=schemas.AssignmentSummary)
+async def assignment_summary(assignment_id: int, db: Session = Depends(get_session)):
+    summary = await crud_async.get_assignment_summary(db, assignment_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    instrumentation.add_rows(1)
+    return summary
+
+@app.get("/summary/students", response_model=list[schemas.StudentSummary])
+async def student_summaries(db: Session = Depends(get_session)):
+    summaries = await crud_async.get_student_summaries(db)
+    instrumentation.add_rows(len(summaries))
+    return summaries
+
+@app.get("/summary/students/{student_id}", response_model=schemas.StudentSummary)
+async def student_summary(student_id: int, db: Session = Depends(get_session)):
+    summary = await crud_async.get_student_summary(db, student_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Student not found")
+    instrumentation.add_rows(1)
+    return summary
+
+async def _analytics_entries(db, assignment_ids, bucket):
+    # Each assignment's analytics is cached on its own under its submissions
+    # namespace, so a write recomputes only the assignment it touched.
+    # As in _cached, a client reading its own writes recomputes from the primary.
+    keys = {i: cache.read_cache.key("analytics", {"assignment_id": i, "bucket": bucket}, [f"submissions:{i}"]) for i in assignment_ids}
+    primary_only = database.primary_only.get()
+    entries, missing = {}, []
+    for assignment_id, key in keys.items():
+        entry = None if primary_only else cache.read_cache.get(key)
+        if entry is None:
+            missing.append(assignment_id)
+        else:
+            entries[assignment_id] = entry
+    for chunk in crud._chunks(missing):
+        for row in await crud_async.get_submission_analytics(db, chunk, bucket):
+            body = orjson.dumps(schemas.SubmissionAnalytics(**row).dict())
+            entries[row["assignment_id"]] = cache.read_cache.set(keys[row["assignment_id"]], body, {"Last-Modified": _http_now()})
+    instrumentation.add_rows(len(entries))
+    return [entries[i] for i in assignment_ids if i in entries]
+
+@app.get("/analytics/submissions", response_model=list[schemas.SubmissionAnalytics], dependencies=_limited("analytics"))
+async def submission_analytics(request: Request, bucket: Literal["hour", "day"] = "day", db: Session = Depends(get_session)):
+    async def build():
+        assignment_ids = await crud_async.get_assignment_ids(db)
+        entries = await _analytics_entries(db, assignment_ids, bucket)
+        return b"[" + b",".join(entry.body for entry in entries) + b"]", {}
+    return await _cached(request, ["assignments", "submissions"], build)
+
+@app.get("/analytics/submissions/{assignment_id}", response_model=schemas.SubmissionAnalytics, dependencies=_limited("analytics"))
+async def assignment_submission_analytics(assignment_id: int, request: Request, bucket: Literal["hour", "day"] = "day", db: Session = Depends(get_session)):
+    entries = await _analytics_entries(db, [assignment_id], bucket)
+    if not entries:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    return _entry_response(request, entries[0])
+
+@app.get("/metrics/pool")
+def connection_pool_metrics():
+    return database.pool_metrics()
+
+
+@app.get("/metrics")
+def request_metrics():
+    return {
+        "routes": instrumentation.route_metrics(),
+        "slow_queries": list(instrumentation.slow_queries),
+        "pool": database.pool_metrics(),
+    }
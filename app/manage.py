@@ -0,0 +1,87 @@
+import argparse
+import os
+from datetime import timedelta
+
+# Commands import the app lazily: serve has to set the pool environment
+# before app.database creates its engines.
+
+def rebuild_summaries(args):
+    from . import crud, models
+    from .database import SessionLocal, engine
+    # Creates the summary tables first when upgrading an existing database.
+    models.create_schema(engine)
+    db = SessionLocal()
+    try:
+        crud.rebuild_summaries(db)
+    finally:
+        db.close()
+    print("Rebuilt assignment and student summaries.")
+
+def init_db(args):
+    from . import models
+    from .database import engine
+    models.create_schema(engine)
+    print("Created any missing tables and indexes.")
+
+def prune_changes(args):
+    from . import crud
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        pruned = crud.prune_changes(db, timedelta(days=args.days))
+    finally:
+        db.close()
+    print(f"Pruned {pruned} changes older than {args.days} days.")
+
+def pool_per_worker(max_connections: int, workers: int):
+    # Each worker gets an equal, fixed pool with no overflow, so the workers
+    # together never open more than max_connections to one database. A worker
+    # uses one pool per database: under DB_ASYNC the sync engine is only used
+    # for schema setup and is disposed right after it.
+    if max_connections < workers:
+        raise SystemExit(f"--max-connections {max_connections} is less than one per worker ({workers})")
+    return max_connections // workers
+
+def serve(args):
+    import uvicorn
+    if args.max_connections:
+        os.environ["DB_POOL_SIZE"] = str(pool_per_worker(args.max_connections, args.workers))
+        os.environ["DB_MAX_OVERFLOW"] = "0"
+    if args.workers > 1 and not os.getenv("CACHE_URL"):
+        # Each worker would keep its own in-process cache and never see the
+        # invalidations of writes served by the others.
+        print("CACHE_URL is not set: the read cache is off with more than one worker.")
+        os.environ["CACHE_TTL"] = "0"
+    if os.getenv("DB_CREATE_SCHEMA", "1") == "1":
+        # Create the schema once here instead of in every worker at once.
+        init_db(args)
+        from .database import engine
+        engine.dispose()
+        os.environ["DB_CREATE_SCHEMA"] = "0"
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+
+COMMANDS = {
+    "init-db": init_db,
+    "rebuild-summaries": rebuild_summaries,
+    "prune-changes": prune_changes,
+    "serve": serve,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--days", type=int, default=7, help="prune-changes: keep this many days of changes")
+    parser.add_argument("--host", default="127.0.0.1", help="serve: interface to bind")
+    parser.add_argument("--port", type=int, default=8000, help="serve: port to bind")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="serve: worker processes")
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=int(os.getenv("DB_MAX_CONNECTIONS", "0")),
+        help="serve: connections all workers may hold to each database (default: DB_MAX_CONNECTIONS; 0 keeps DB_POOL_SIZE)",
+    )
+    args = parser.parse_args(argv)
+    COMMANDS[args.command](args)
+
+if __name__ == "__main__":
+    main()
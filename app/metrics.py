@@ -0,0 +1,32 @@
+import threading
+
+DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class Histogram:
+    """Thread-safe histogram with cumulative (Prometheus-style) buckets."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.bounds = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            summary = {"count": self.count, "sum": round(self.sum, 3), "max": round(self.max, 3)}
+        buckets, total = {}, 0
+        for bound, n in zip([*map(str, self.bounds), "+Inf"], counts):
+            total += n
+            buckets[bound] = total
+        return {**summary, "buckets": buckets}
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import JSON, Column, Integer, String, DateTime, ForeignKey, Index, UniqueConstraint, inspect
+from sqlalchemy.orm import Session, relationship
 from datetime import datetime
 from .database import Base
 
@@ -8,7 +8,7 @@ class Student(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
-    submissions = relationship("Submission", back_populates="student", cascade="all, delete")
+    submissions = relationship("Submission", back_populates="student", cascade="all, delete", passive_deletes=True)
 
 class Assignment(Base):
     __tablename__ = "assignments"
@@ -16,14 +16,54 @@ class Assignment(Base):
     title = Column(String, nullable=False)
     description = Column(String)
     due_date = Column(DateTime, nullable=False)
-    submissions = relationship("Submission", back_populates="assignment", cascade="all, delete")
+    submissions = relationship("Submission", back_populates="assignment", cascade="all, delete", passive_deletes=True)
 
 class Submission(Base):
     __tablename__ = "submissions"
     id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("students.id"))
-    assignment_id = Column(Integer, ForeignKey("assignments.id"))
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"))
+    assignment_id = Column(Integer, ForeignKey("assignments.id", ondelete="CASCADE"))
     submitted_at = Column(DateTime, default=datetime.utcnow)
     student = relationship("Student", back_populates="submissions")
     assignment = relationship("Assignment", back_populates="submissions")
-    __table_args__ = (UniqueConstraint('student_id', 'assignment_id', name='_student_assignment_uc'),)
\ No newline at end of file
+    __table_args__ = (
+        UniqueConstraint('student_id', 'assignment_id', name='_student_assignment_uc'),
+        Index('ix_submissions_assignment_student', 'assignment_id', 'student_id'),
+        Index('ix_submissions_assignment_submitted', 'assignment_id', 'submitted_at'),
+    )
+
+# Denormalized completion counters, kept in step with submissions by app/crud.py.
+class AssignmentSummary(Base):
+    __tablename__ = "assignment_summaries"
+    assignment_id = Column(Integer, ForeignKey("assignments.id", ondelete="CASCADE"), primary_key=True)
+    submitted_count = Column(Integer, nullable=False, default=0)
+
+class StudentSummary(Base):
+    __tablename__ = "student_summaries"
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"), primary_key=True)
+    completed_count = Column(Integer, nullable=False, default=0)
+
+# Append-only log of row changes, written by app/crud.py in the same
+# transaction as the change; the id is the cursor for GET /changes.
+class Change(Base):
+    __tablename__ = "changes"
+    id = Column(Integer, primary_key=True)
+    entity = Column(String, nullable=False)
+    op = Column(String, nullable=False)
+    data = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    __table_args__ = {"sqlite_autoincrement": True}
+
+def create_schema(bind):
+    # create_all skips tables that already exist, and with them any index
+    # added to the models since; create those indexes on their own.
+    new_summaries = not all(inspect(bind).has_table(m.__tablename__) for m in (AssignmentSummary, StudentSummary))
+    Base.metadata.create_all(bind=bind)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+    if new_summaries:
+        # Counters added to an existing database start from its submissions.
+        from . import crud
+        with Session(bind) as db:
+            crud.rebuild_summaries(db)
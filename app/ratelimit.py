@@ -0,0 +1,60 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+
+# Multiplies every route's limits; 0 turns rate limiting off.
+RATE_LIMIT_SCALE = float(os.getenv("RATE_LIMIT_SCALE", "1"))
+MAX_BUCKETS = 10000
+
+class TokenBucketLimiter:
+    """Token buckets in process memory, evicting the least recently used."""
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def acquire(self, key, rate: float, burst: float, now: float | None = None):
+        # Takes a token from key's bucket. Returns 0, or the seconds until a
+        # token is available if the bucket is empty.
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return wait
+
+limiter = TokenBucketLimiter()
+
+def rate_limit(rate: float, burst: int, paged: tuple[float, int] | None = None):
+    """Route dependency allowing each client rate requests per second, in bursts of up to burst.
+
+    With paged=(rate, burst), keyset continuation pages (requests with both
+    after and limit parameters) draw on that limit instead, in one bucket per
+    client shared by every paged route, so loading a long list page by page is
+    not throttled as if each page were a fresh read. Only keyset list routes
+    should pass paged.
+    """
+    async def dependency(request: Request):
+        if RATE_LIMIT_SCALE <= 0:
+            return
+        client = request.client.host if request.client else ""
+        if paged is not None and "after" in request.query_params and "limit" in request.query_params:
+            key, (limit_rate, limit_burst) = ("pages", client), paged
+        else:
+            route = request.scope.get("route")
+            key, limit_rate, limit_burst = (request.method, route.path if route else request.url.path, client), rate, burst
+        wait = limiter.acquire(key, limit_rate * RATE_LIMIT_SCALE, max(1, limit_burst * RATE_LIMIT_SCALE))
+        if wait:
+            raise HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": str(math.ceil(wait))})
+    return dependency
@@ -0,0 +1,46 @@
+import codecs
+import csv
+import json
+
+async def iter_lines(chunks):
+    # Decode an async stream of byte chunks into complete text lines.
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+async def iter_rows(chunks, fmt: str):
+    """Yield one dict per non-empty CSV/NDJSON record, or None for records that cannot be parsed."""
+    header = None
+    pending = None
+    async for line in iter_lines(chunks):
+        if pending is not None:
+            # A quoted CSV field spans lines until its quotes balance;
+            # doubled quotes inside it do not change the parity.
+            line = pending + "\n" + line
+            pending = None
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+            continue
+        if line.count('"') % 2:
+            pending = line
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [h.strip().lower() for h in values]
+            continue
+        yield dict(zip(header, (v.strip() for v in values))) if len(values) == len(header) else None
+    if pending is not None:
+        yield None  # an unterminated quoted field
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
+from typing import Literal
 
 class StudentBase(BaseModel):
     name: str
@@ -36,4 +37,86 @@ class Submission(BaseModel):
     assignment_id: int
     submitted_at: datetime
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class MatrixStudent(BaseModel):
+    id: int
+    name: str
+    email: str
+    class Config:
+        orm_mode = True
+
+class MatrixAssignment(BaseModel):
+    id: int
+    title: str
+    class Config:
+        orm_mode = True
+
+class Matrix(BaseModel):
+    students: list[MatrixStudent]
+    assignments: list[MatrixAssignment]
+    # submitted[i] holds the assignment ids submitted by students[i]
+    submitted: list[list[int]]
+
+
+class SubmissionOp(BaseModel):
+    student_id: int
+    assignment_id: int
+    op: Literal["add", "remove"]
+
+class SubmissionOpResult(SubmissionOp):
+    status: Literal["created", "exists", "deleted", "not_found"]
+
+class ImportResult(BaseModel):
+    inserted: int
+    duplicates: int
+    invalid: int
+
+class AssignmentSummary(BaseModel):
+    assignment_id: int
+    submitted_count: int
+    class Config:
+        orm_mode = True
+
+class StudentSummary(BaseModel):
+    student_id: int
+    completed_count: int
+    class Config:
+        orm_mode = True
+
+class BulkDelete(BaseModel):
+    ids: list[int]
+
+class BulkDeleteResult(BaseModel):
+    deleted: list[int]
+
+class Change(BaseModel):
+    id: int
+    entity: Literal["student", "assignment", "submission"]
+    op: Literal["insert", "update", "delete"]
+    data: dict
+
+    class Config:
+        orm_mode = True
+
+class ChangeFeed(BaseModel):
+    cursor: int
+    changes: list[Change]
+
+class SubmissionBucket(BaseModel):
+    start: datetime
+    count: int
+
+class LeadTimePercentiles(BaseModel):
+    p50: float | None
+    p90: float | None
+    p99: float | None
+
+class SubmissionAnalytics(BaseModel):
+    assignment_id: int
+    due_date: datetime
+    total: int
+    on_time: int
+    late: int
+    buckets: list[SubmissionBucket]
+    lead_time_hours: LeadTimePercentiles
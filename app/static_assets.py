@@ -0,0 +1,71 @@
+import hashlib
+import os
+import re
+from urllib.parse import parse_qs
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# src/href attributes naming a local .js or .css file, with any ?v= already on it.
+ASSET_REF = re.compile(r'(?P<attr>(?:src|href)=")(?P<path>[^":?#]+\.(?:js|css))(?:\?v=[^"]*)?"')
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles with content-hashed asset URLs.
+
+    HTML pages are served with each local script and stylesheet reference
+    rewritten to name?v=<hash of its content>. A request carrying the current
+    hash may be cached as immutable; anything else must revalidate through the
+    ETag and Last-Modified headers StaticFiles already sends.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._hashes = {}
+
+    def asset_hash(self, path: str):
+        full_path, stat = self.lookup_path(path)
+        if stat is None:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(full_path)
+        if cached is None or cached[0] != version:
+            with open(full_path, "rb") as f:
+                cached = (version, hashlib.blake2b(f.read(), digest_size=6).hexdigest())
+            self._hashes[full_path] = cached
+        return cached[1]
+
+    def _fingerprint(self, html: str, page: str):
+        base = os.path.dirname(page)
+
+        def replace(match):
+            digest = self.asset_hash(os.path.normpath(os.path.join(base, match["path"])))
+            if digest is None:
+                return match[0]
+            return f'{match["attr"]}{match["path"]}?v={digest}"'
+
+        return ASSET_REF.sub(replace, html)
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if path.endswith(".html") and response.status_code in (200, 304):
+            return self._html_response(path, scope)
+        version = parse_qs(scope.get("query_string", b"").decode()).get("v", [None])[0]
+        if response.status_code in (200, 304):
+            current = version is not None and version == self.asset_hash(path)
+            response.headers["Cache-Control"] = IMMUTABLE if current else REVALIDATE
+        return response
+
+    def _html_response(self, path: str, scope):
+        full_path, _ = self.lookup_path(path)
+        with open(full_path, encoding="utf-8") as f:
+            body = self._fingerprint(f.read(), path).encode()
+        # The page changes when it or any asset it names changes, so its ETag
+        # is taken from the rewritten body.
+        etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        headers = {"ETag": etag, "Cache-Control": REVALIDATE}
+        if self.is_not_modified(Headers(headers), Headers(scope=scope)):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="text/html", headers=headers)
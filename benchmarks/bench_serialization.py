@@ -0,0 +1,56 @@
+"""Compare the list-endpoint serialization paths.
+
+    python benchmarks/bench_serialization.py --rows 50000
+
+"schema" loads ORM objects and validates each row through the Pydantic schema
+(what FastAPI's response_model does); "fast" selects column tuples and encodes
+them with orjson (the FAST_JSON path in app/main.py).
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app import crud, main, models, schemas
+from app.database import Base
+
+def seed(db, rows: int):
+    due = datetime(2025, 7, 1, 12, 0)
+    db.execute(insert(models.Student), [{"name": f"Student {i}", "email": f"s{i}@example.com"} for i in range(rows)])
+    db.execute(insert(models.Assignment), [{"title": f"A{i}", "description": "D", "due_date": due + timedelta(hours=i)} for i in range(rows)])
+    db.commit()
+
+def best_of(db, repeat: int, fn):
+    timings = []
+    for _ in range(repeat):
+        db.expunge_all()
+        start = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(body)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    seed(db, args.rows)
+
+    for name, fetch, schema in (
+        ("students", crud.get_all_students, schemas.Student),
+        ("assignments", crud.get_all_assignments, schemas.Assignment),
+    ):
+        slow, size = best_of(db, args.repeat, lambda: main._rows_body(schema, fetch(db), columns=False))
+        fast, fast_size = best_of(db, args.repeat, lambda: main._rows_body(schema, fetch(db, columns=True), columns=True))
+        print(f"{name:<12} {args.rows} rows  schema {slow * 1000:8.1f} ms  fast {fast * 1000:8.1f} ms  "
+              f"speedup x{slow / fast:.1f}  ({size} / {fast_size} bytes)")
@@ -0,0 +1,75 @@
+"""Measure how long a fresh worker process takes to become ready.
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --database-url postgresql+psycopg2://... --runs 10
+
+Each run starts a new interpreter and reports three phases:
+- "import": time to import app.main.
+- "startup": time to run the lifespan startup, i.e. the schema check unless
+  DB_CREATE_SCHEMA=0.
+- "first_request": time to serve GET /students/?limit=1.
+
+Medians and maxima over the runs are printed and, with --output, written as
+JSON. Run it from the repository root. The default database is a fresh SQLite
+file.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Runs in the child interpreter; prints the phase timings as JSON.
+CHILD = """
+import json, time
+start = time.perf_counter()
+from app import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    started = time.perf_counter()
+    client.get("/students/?limit=1").raise_for_status()
+    served = time.perf_counter()
+print(json.dumps({
+    "import": (imported - start) * 1000,
+    "startup": (started - imported) * 1000,
+    "first_request": (served - started) * 1000,
+}))
+"""
+
+def run_once(env):
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--no-create-schema", action="store_true", help="start with DB_CREATE_SCHEMA=0 (after one run creates it)")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(tmp, 'startup.db')}"}
+        # One untimed run creates the schema and warms the OS file cache.
+        run_once(env)
+        if args.no_create_schema:
+            env["DB_CREATE_SCHEMA"] = "0"
+        runs = [run_once(env) for _ in range(args.runs)]
+
+    results = {}
+    for phase in ("import", "startup", "first_request"):
+        values = [r[phase] for r in runs]
+        results[phase] = {"median_ms": round(statistics.median(values), 1), "max_ms": round(max(values), 1)}
+        print(f"{phase:<14} median {results[phase]['median_ms']:8.1f} ms  max {results[phase]['max_ms']:8.1f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"runs": args.runs, "create_schema": not args.no_create_schema, "phases": results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+if __name__ == "__main__":
+    main()
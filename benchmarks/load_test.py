@@ -0,0 +1,339 @@
+"""Latency and throughput benchmark for every API route.
+
+Seeds a synthetic dataset, drives each route with concurrent clients and writes
+per-route p50/p95/p99 latency, requests/sec and SQL statements per request to a
+JSON file. Pass a previous result with --compare to flag regressions.
+
+    python benchmarks/load_test.py --students 2000 --assignments 50 --density 0.5 \\
+        --concurrency 16 --requests 200 --output bench.json
+    python benchmarks/load_test.py ... --output new.json --compare bench.json
+
+Run it from the repository root. The app is driven in-process through
+httpx's ASGI transport, against a fresh SQLite file by default; pass
+--database-url to benchmark a local PostgreSQL database instead (its tables are
+dropped and re-seeded). Statement counts come from engine events.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+def percentile(sorted_values, pct: float):
+    if not sorted_values:
+        return None
+    # Nearest rank: the smallest value with at least pct% of values at or below it.
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def seed(engine, students: int, assignments: int, density: float, rng):
+    from sqlalchemy import insert
+    from app import crud, models
+    from app.database import Base, SessionLocal
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    due = datetime(2025, 7, 1, 12, 0)
+    db = SessionLocal()
+    try:
+        rows = [{"name": f"Student {i}", "email": f"student{i}@example.com"} for i in range(students)]
+        for chunk in crud._chunks(rows):
+            db.execute(insert(models.Student), chunk)
+        db.execute(insert(models.Assignment), [
+            {"title": f"Assignment {i}", "description": "Synthetic", "due_date": due + timedelta(days=i)}
+            for i in range(assignments)
+        ])
+        submissions = [
+            {"student_id": s, "assignment_id": a, "submitted_at": due + timedelta(days=a - 1, minutes=rng.randint(0, 2880))}
+            for s in range(1, students + 1)
+            for a in range(1, assignments + 1)
+            if rng.random() < density
+        ]
+        for chunk in crud._chunks(submissions):
+            db.execute(insert(models.Submission), chunk)
+        db.commit()
+        crud.rebuild_summaries(db)
+    finally:
+        db.close()
+    return len(submissions)
+
+def add_delete_targets(model, count: int, per_request: int, students: int):
+    """Insert rows for a bulk-delete scenario to remove, each with one submission; returns their ids."""
+    from sqlalchemy import insert
+    from app import crud, models
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        n = count * per_request
+        if model is models.Student:
+            rows = [{"name": f"Doomed {i}", "email": f"doomed{i}@example.com"} for i in range(n)]
+        else:
+            rows = [{"title": f"Doomed {i}", "description": "Synthetic", "due_date": datetime(2025, 7, 1)} for i in range(n)]
+        ids = [row.id for row in db.execute(insert(model).returning(model.id), rows)]
+        if model is models.Student:
+            pairs = [{"student_id": i, "assignment_id": 1} for i in ids]
+        else:
+            pairs = [{"student_id": 1 + k % students, "assignment_id": i} for k, i in enumerate(ids)]
+        db.execute(insert(models.Submission), pairs)
+        db.commit()
+        crud.rebuild_summaries(db)
+    finally:
+        db.close()
+    return ids
+
+def scenarios(students: int, assignments: int, rng):
+    """(name, make_request[, setup]) tuples; make_request(i) returns (method, url, kwargs) for the i-th call.
+
+    setup(count), if given, runs before the route's first call; count is the number of calls.
+    """
+    from app import models
+    doomed = {}
+
+    def bulk_delete(model, per_request: int):
+        def setup(count):
+            doomed[model] = add_delete_targets(model, count, per_request, students)
+        def make_request(i):
+            return {"json": {"ids": doomed[model][i * per_request:(i + 1) * per_request]}}
+        return make_request, setup
+
+    delete_students, setup_students = bulk_delete(models.Student, 10)
+    delete_assignments, setup_assignments = bulk_delete(models.Assignment, 2)
+
+    def student():
+        return rng.randint(1, students)
+
+    def assignment():
+        return rng.randint(1, assignments)
+
+    return [
+        ("GET /students/", lambda i: ("GET", "/students/", {})),
+        ("GET /students/?limit=100", lambda i: ("GET", f"/students/?limit=100&after={rng.randint(0, students)}", {})),
+        ("GET /students/?stream=true", lambda i: ("GET", "/students/?stream=true", {})),
+        ("GET /assignments/", lambda i: ("GET", "/assignments/", {})),
+        ("GET /submissions/", lambda i: ("GET", "/submissions/", {})),
+        ("GET /submissions/?limit=500", lambda i: ("GET", f"/submissions/?limit=500&after={rng.randint(0, students)}", {})),
+        ("GET /students/completed/{assignment_id}", lambda i: ("GET", f"/students/completed/{assignment()}", {})),
+        ("GET /students/pending/{assignment_id}", lambda i: ("GET", f"/students/pending/{assignment()}", {})),
+        ("GET /students/pending/{assignment_id}?count_only", lambda i: ("GET", f"/students/pending/{assignment()}?count_only=true", {})),
+        ("GET /matrix", lambda i: ("GET", "/matrix", {})),
+        ("GET /matrix?limit=500", lambda i: ("GET", f"/matrix?limit=500&after={rng.randint(0, students)}", {})),
+        ("GET /summary/assignments", lambda i: ("GET", "/summary/assignments", {})),
+        ("GET /summary/assignments/{assignment_id}", lambda i: ("GET", f"/summary/assignments/{assignment()}", {})),
+        ("GET /summary/students", lambda i: ("GET", "/summary/students", {})),
+        ("GET /summary/students/{student_id}", lambda i: ("GET", f"/summary/students/{student()}", {})),
+        ("GET /analytics/submissions", lambda i: ("GET", "/analytics/submissions", {})),
+        ("GET /analytics/submissions/{assignment_id}?bucket=hour", lambda i: ("GET", f"/analytics/submissions/{assignment()}?bucket=hour", {})),
+        ("GET /changes", lambda i: ("GET", "/changes?since=0&limit=100", {})),
+        ("GET /metrics/pool", lambda i: ("GET", "/metrics/pool", {})),
+        ("GET /metrics", lambda i: ("GET", "/metrics", {})),
+        ("POST /students/", lambda i: ("POST", "/students/", {"json": {"name": f"Bench {i}", "email": f"bench{i}@example.com"}})),
+        ("PUT /students/{student_id}", lambda i: ("PUT", f"/students/{student()}", {"json": {"name": f"Renamed {i}"}})),
+        ("POST /students/import", lambda i: ("POST", "/students/import", {
+            "content": "name,email\n" + "".join(f"Imported {i}-{j},imported{i}-{j}@example.com\n" for j in range(100)),
+            "headers": {"Content-Type": "text/csv"},
+        })),
+        ("POST /assignments/", lambda i: ("POST", "/assignments/", {"json": {"title": f"Bench {i}", "description": "D", "due_date": "2025-09-01T12:00:00"}})),
+        ("POST /submissions/", lambda i: ("POST", f"/submissions/?student_id={student()}&assignment_id={assignment()}", {})),
+        ("DELETE /submissions/", lambda i: ("DELETE", f"/submissions/?student_id={student()}&assignment_id={assignment()}", {})),
+        ("POST /submissions/bulk", lambda i: ("POST", "/submissions/bulk", {"json": [
+            {"student_id": student(), "assignment_id": assignment(), "op": rng.choice(["add", "remove"])} for _ in range(50)
+        ]})),
+        # Deletes the assignments created by "POST /assignments/" above.
+        ("DELETE /assignments/{assignment_id}", lambda i: ("DELETE", f"/assignments/{assignments + 1 + i}", {})),
+        ("POST /students/bulk-delete", lambda i: ("POST", "/students/bulk-delete", delete_students(i)), setup_students),
+        ("POST /assignments/bulk-delete", lambda i: ("POST", "/assignments/bulk-delete", delete_assignments(i)), setup_assignments),
+        # Time to the first event: the backfill of the changes the writes above logged.
+        ("GET /changes/stream", lambda i: ("STREAM", f"/changes/stream?since={rng.randint(0, 50)}", {})),
+    ]
+
+async def first_event(app, url: str):
+    """GET a server-sent event stream until its first event; returns the status.
+
+    httpx's ASGI transport waits for the whole body, which a stream never
+    finishes, so this drives the ASGI app directly and disconnects.
+    """
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    received = asyncio.Queue()
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await received.put(message)
+
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        status, body = None, b""
+        while b"\n\n" not in body:
+            message = await received.get()
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                body += message.get("body", b"")
+                if not message.get("more_body", False):
+                    break
+        return status
+    finally:
+        disconnected.set()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+async def run_route(client, app, make_request, requests: int, concurrency: int, offset: int = 0):
+    latencies, errors = [], 0
+    counter = iter(range(offset, offset + requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = make_request(i)
+            start = time.perf_counter()
+            if method == "STREAM":
+                status = await first_event(app, url)
+            else:
+                resp = await client.request(method, url, **kwargs)
+                await resp.aread()
+                status = resp.status_code
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status >= 400 and not (status == 404 and method == "DELETE"):
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+async def run(args):
+    import httpx
+    from sqlalchemy import event
+    from app import database, main
+    from app.database import engine
+
+    rng = random.Random(args.seed)
+    submissions = seed(engine, args.students, args.assignments, args.density, rng)
+    statements = 0
+
+    def count_statement(*_):
+        nonlocal statements
+        statements += 1
+
+    # Under DB_ASYNC requests run on the async engine; create it now so its
+    # statements are counted too.
+    engines = [engine]
+    if database.USE_ASYNC_DB:
+        database.get_async_sessionmaker()
+        engines.append(database.async_engine.sync_engine)
+    for e in engines:
+        event.listen(e, "before_cursor_execute", count_statement)
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for name, make_request, *setup in scenarios(args.students, args.assignments, rng):
+            if args.routes and not any(r in name for r in args.routes):
+                continue
+            warmup = min(args.warmup, args.requests)
+            if setup:
+                setup[0](warmup + args.requests)
+            await run_route(client, main.app, make_request, warmup, args.concurrency)
+            statements = 0
+            latencies, errors, elapsed = await run_route(client, main.app, make_request, args.requests, args.concurrency, offset=warmup)
+            latencies.sort()
+            results[name] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "p50_ms": round(percentile(latencies, 50), 3),
+                "p95_ms": round(percentile(latencies, 95), 3),
+                "p99_ms": round(percentile(latencies, 99), 3),
+                "rps": round(len(latencies) / elapsed, 1),
+                "queries_per_request": round(statements / len(latencies), 2),
+            }
+            print(f"{name:<52} p50 {results[name]['p50_ms']:8.2f}  p95 {results[name]['p95_ms']:8.2f}  "
+                  f"p99 {results[name]['p99_ms']:8.2f} ms  {results[name]['rps']:8.1f} req/s  "
+                  f"{results[name]['queries_per_request']:6.2f} q/req  {errors} errors")
+    for e in engines:
+        event.remove(e, "before_cursor_execute", count_statement)
+    return {
+        "meta": {
+            "students": args.students,
+            "assignments": args.assignments,
+            "density": args.density,
+            "submissions": submissions,
+            "concurrency": args.concurrency,
+            "requests_per_route": args.requests,
+            "seed": args.seed,
+            "database": engine.dialect.name,
+            "python": platform.python_version(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        },
+        "routes": results,
+    }
+
+def compare(current, baseline, threshold: float):
+    """Print per-route changes against a baseline; return the routes that regressed."""
+    regressions = []
+    print(f"\n{'route':<52} {'p95 before':>11} {'p95 after':>11} {'change':>8}  {'rps change':>10}")
+    for name, after in current["routes"].items():
+        before = baseline.get("routes", {}).get(name)
+        if not before:
+            continue
+        change = (after["p95_ms"] - before["p95_ms"]) / before["p95_ms"] if before["p95_ms"] else 0
+        rps_change = (after["rps"] - before["rps"]) / before["rps"] if before["rps"] else 0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<52} {before['p95_ms']:11.2f} {after['p95_ms']:11.2f} {change:+8.0%}  {rps_change:+10.0%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--assignments", type=int, default=20)
+    parser.add_argument("--density", type=float, default=0.5, help="fraction of student x assignment pairs submitted")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per route")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per route")
+    parser.add_argument("--routes", nargs="*", help="only run routes whose name contains one of these strings")
+    parser.add_argument("--database-url", help="database to seed and benchmark (default: a temporary SQLite file)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the read cache")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the per-client rate limits (all requests come from one client)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="baseline JSON from a previous run")
+    parser.add_argument("--fail-threshold", type=float, default=0.2, help="p95 increase that counts as a regression")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmpdir.name}/bench.db"
+    if args.no_cache:
+        os.environ["CACHE_TTL"] = "0"
+    if not args.rate_limit:
+        os.environ["RATE_LIMIT_SCALE"] = "0"
+
+    result = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.fail_threshold)
+        if regressions:
+            sys.exit(f"{len(regressions)} route(s) regressed by more than {args.fail_threshold:.0%} at p95")
+
+if __name__ == "__main__":
+    main()
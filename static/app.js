@@ -1,68 +1,219 @@
+// --- Dashboard state ---
+// Every table renders from these maps, in id order. Fetches and the change
+// feed update the maps, then ask the tables to redraw what is on screen.
+const students = new Map();     // id -> { id, name, email }
+const assignments = new Map();  // id -> assignment; only { id, title } until /assignments/ has loaded
+const submitted = new Map();    // student id -> Set of submitted assignment ids
+let editing = null;             // { id, name, email, message, error } while a student's form is open
+
+// Rows per request when loading the keyset-paginated lists.
+const PAGE_SIZE = 500;
+
+function escapeHtml(value) {
+  return String(value).replace(/[&<>"']/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[c]));
+}
+
+// Parses markup into a DocumentFragment, so a batch of rows is inserted in one step.
+function fragment(html) {
+  const template = document.createElement('template');
+  template.innerHTML = html;
+  return template.content;
+}
+
+// Attempts fetchRetrying makes before handing a 429 back to the caller.
+const MAX_ATTEMPTS = 5;
+
+// fetch that waits out rate limiting: a 429 is retried after its Retry-After
+// delay, or an exponential backoff if that is longer, plus random jitter so
+// clients throttled together do not retry together. After MAX_ATTEMPTS the
+// 429 is returned like any other response.
+async function fetchRetrying(url, options) {
+  for (let attempt = 1; ; attempt++) {
+    const res = await fetch(url, options);
+    if (res.status !== 429 || attempt === MAX_ATTEMPTS) return res;
+    const seconds = Math.max(Number(res.headers.get('Retry-After')) || 1, 2 ** (attempt - 1));
+    await new Promise(resolve => setTimeout(resolve, seconds * 1000 * (1 + Math.random() / 2)));
+  }
+}
+
+async function fetchOk(url) {
+  const res = await fetchRetrying(url);
+  if (!res.ok) throw new Error(`GET ${url} failed with ${res.status}`);
+  return res;
+}
+
+// Requests path one page at a time with limit/after. handlePage receives each
+// response and returns that page's id-ordered rows. A failed page throws.
+async function fetchPages(path, handlePage) {
+  let after = null;
+  for (;;) {
+    const res = await fetchOk(`${path}?limit=${PAGE_SIZE}${after === null ? '' : `&after=${after}`}`);
+    const rows = await handlePage(res);
+    if (rows.length < PAGE_SIZE) return;
+    after = rows[rows.length - 1].id;
+  }
+}
+
+// --- Virtualized tables ---
+// Only the rows scrolled into view, plus a margin, exist in the DOM. Spacer
+// rows above and below stand in for the rest, so the scrollbar stays true.
+class VirtualTable {
+  constructor(tableId, rowHtml, keys) {
+    this.table = document.getElementById(tableId);
+    this.tbody = this.table.querySelector('tbody');
+    this.viewport = this.table.parentElement;
+    this.rowHtml = rowHtml;  // (key, index) -> '<tr>...</tr>'
+    this.keys = keys;        // () -> row keys in display order
+    this.cachedKeys = null;
+    this.rowHeight = 0;
+    this.overscan = 10;
+    this.range = null;
+    this.frame = null;
+    this.viewport.addEventListener('scroll', () => this.schedule(false), { passive: true });
+    window.addEventListener('resize', () => this.schedule(false));
+  }
+
+  // Redraws on the next frame. Scrolling only redraws when the visible range
+  // moves; changed data always redraws.
+  schedule(changed = true) {
+    if (changed) {
+      this.range = null;
+      this.cachedKeys = null;
+    }
+    if (this.frame === null) {
+      this.frame = requestAnimationFrame(() => {
+        this.frame = null;
+        this.render();
+      });
+    }
+  }
+
+  render() {
+    const keys = this.cachedKeys || (this.cachedKeys = this.keys());
+    const rowHeight = this.rowHeight || 40;
+    const offset = Math.max(0, this.viewport.scrollTop - this.tbody.offsetTop);
+    const start = Math.max(0, Math.floor(offset / rowHeight) - this.overscan);
+    const end = Math.min(keys.length, start + Math.ceil(this.viewport.clientHeight / rowHeight) + 2 * this.overscan);
+    if (this.range && this.range[0] === start && this.range[1] === end && this.range[2] === keys.length) return;
+    this.range = [start, end, keys.length];
+
+    const focused = this.tbody.contains(document.activeElement) ? document.activeElement.id : null;
+    let html = this.spacerHtml(start * rowHeight);
+    for (let i = start; i < end; i++) html += this.rowHtml(keys[i], i);
+    html += this.spacerHtml((keys.length - end) * rowHeight);
+    this.tbody.replaceChildren(fragment(html));
+    if (focused && document.getElementById(focused)) document.getElementById(focused).focus();
+
+    if (!this.rowHeight) {
+      const row = this.tbody.querySelector('tr:not(.spacer)');
+      if (row && row.offsetHeight) {
+        this.rowHeight = row.offsetHeight;
+        this.schedule();
+      }
+    }
+  }
+
+  spacerHtml(height) {
+    if (!height) return '';
+    const columns = this.table.tHead.rows[0].cells.length;
+    return `<tr class="spacer" style="height:${height}px"><td colspan="${columns}"></td></tr>`;
+  }
+}
+
+const studentsTable = new VirtualTable('studentsTable', studentRowHtml, () => [...students.keys()]);
+const assignmentsTable = new VirtualTable('assignmentsTable', assignmentRowHtml, () => [...assignments.keys()]);
+const matrixTable = new VirtualTable('matrixTable', matrixRowHtml, () => [...students.keys()]);
+
+function renderAll() {
+  renderMatrixHeader();
+  [studentsTable, assignmentsTable, matrixTable].forEach(t => t.schedule());
+}
+
 // --- Student CRUD ---
 async function fetchStudents() {
-  const res = await fetch('/students/');
-  const students = await res.json();
-  const tbody = document.getElementById('studentsTable').querySelector('tbody');
-  tbody.innerHTML = '';
-  students.forEach(s => {
-    const row = `<tr id="student-row-${s.id}">
-      <td>${s.id}</td>
-      <td id="student-name-${s.id}">${s.name}</td>
-      <td id="student-email-${s.id}">${s.email}</td>
-      <td>
-        <button onclick="showUpdateForm(${s.id}, '${s.name}', '${s.email}')">Edit</button>
-      </td>
-    </tr>
-    <tr id="update-form-row-${s.id}" style="display:none;">
+  const loaded = new Map();
+  await fetchPages('/students/', async res => {
+    const page = await res.json();
+    page.forEach(s => loaded.set(s.id, s));
+    return page;
+  });
+  students.clear();
+  loaded.forEach((s, id) => students.set(id, s));
+  renderAll();
+}
+
+function studentRowHtml(id, i) {
+  const s = students.get(id);
+  const stripe = i % 2 ? ' class="alt"' : '';
+  if (editing && editing.id === id) {
+    return `<tr id="update-form-row-${id}"${stripe}>
       <td colspan="4">
-        <form onsubmit="return updateStudent(event, ${s.id})">
-          <input type="text" id="update-name-${s.id}" value="${s.name}" required>
-          <input type="email" id="update-email-${s.id}" value="${s.email}" required>
+        <form data-student="${id}">
+          <input type="text" id="update-name-${id}" name="name" value="${escapeHtml(editing.name)}" required>
+          <input type="email" id="update-email-${id}" name="email" value="${escapeHtml(editing.email)}" required>
           <button type="submit">Save</button>
-          <button type="button" onclick="hideUpdateForm(${s.id})">Cancel</button>
-          <span id="update-result-${s.id}" class="result"></span>
+          <button type="button" data-cancel="${id}">Cancel</button>
+          <span class="result${editing.error ? ' error' : ''}">${escapeHtml(editing.message || '')}</span>
         </form>
       </td>
     </tr>`;
-    tbody.innerHTML += row;
-  });
+  }
+  return `<tr id="student-row-${id}"${stripe}>
+      <td>${id}</td>
+      <td>${escapeHtml(s.name)}</td>
+      <td>${escapeHtml(s.email)}</td>
+      <td><button data-edit="${id}">Edit</button></td>
+    </tr>`;
 }
 
-window.showUpdateForm = function(id, name, email) {
-  document.getElementById(`update-form-row-${id}`).style.display = '';
-  document.getElementById(`student-row-${id}`).style.display = 'none';
-};
+function showUpdateForm(id) {
+  const s = students.get(id);
+  editing = { id, name: s.name, email: s.email, message: '', error: false };
+  studentsTable.schedule();
+}
 
-window.hideUpdateForm = function(id) {
-  document.getElementById(`update-form-row-${id}`).style.display = 'none';
-  document.getElementById(`student-row-${id}`).style.display = '';
-};
+function hideUpdateForm(id) {
+  if (editing && editing.id === id) editing = null;
+  studentsTable.schedule();
+}
 
-window.updateStudent = async function(event, id) {
-  event.preventDefault();
-  const name = document.getElementById(`update-name-${id}`).value;
-  const email = document.getElementById(`update-email-${id}`).value;
+async function updateStudent(id) {
+  const draft = editing;
+  const { name, email } = draft;
   const res = await fetch(`/students/${id}`, {
     method: 'PUT',
     headers: {'Content-Type': 'application/json'},
     body: JSON.stringify({ name, email })
   });
-  const resultSpan = document.getElementById(`update-result-${id}`);
   if (res.ok) {
-    resultSpan.textContent = 'Updated!';
-    resultSpan.className = 'result';
-    await fetchStudents();
-    await fetchMatrix();
+    Object.assign(draft, { message: 'Updated!', error: false });
+    await syncChanges();
   } else {
     const err = await res.json();
-    resultSpan.textContent = err.detail || 'Error';
-    resultSpan.className = 'result error';
+    Object.assign(draft, { message: err.detail || 'Error', error: true });
   }
+  studentsTable.schedule();
   setTimeout(() => {
     hideUpdateForm(id);
   }, 1000);
-  return false;
-};
+}
+
+// The tables' listeners serve every row, including rows rendered later.
+const studentsElement = document.getElementById('studentsTable');
+studentsElement.addEventListener('click', e => {
+  const button = e.target.closest('button[data-edit], button[data-cancel]');
+  if (!button) return;
+  if (button.dataset.edit) showUpdateForm(Number(button.dataset.edit));
+  else hideUpdateForm(Number(button.dataset.cancel));
+});
+studentsElement.addEventListener('input', e => {
+  // Keeps the draft in the state, so redrawing the row does not lose it.
+  if (editing && e.target.name) editing[e.target.name] = e.target.value;
+});
+studentsElement.addEventListener('submit', e => {
+  e.preventDefault();
+  updateStudent(Number(e.target.dataset.student));
+});
 
 document.getElementById('studentForm').onsubmit = async (e) => {
   e.preventDefault();
@@ -79,8 +230,7 @@ document.getElementById('studentForm').onsubmit = async (e) => {
   if (res.ok) {
     result.textContent = 'Student created!';
     result.className = 'result';
-    fetchStudents();
-    fetchMatrix();
+    syncChanges();
   } else {
     const err = await res.json();
     result.textContent = err.detail || 'Error';
@@ -90,36 +240,44 @@ document.getElementById('studentForm').onsubmit = async (e) => {
 
 // --- Assignment CRUD ---
 async function fetchAssignments() {
-  const res = await fetch('/assignments/');
-  const assignments = await res.json();
-  const tbody = document.getElementById('assignmentsTable').querySelector('tbody');
-  tbody.innerHTML = '';
-  assignments.forEach(a => {
-    const due = new Date(a.due_date).toLocaleString();
-    const row = `<tr>
-      <td>${a.id}</td>
-      <td>${a.title}</td>
-      <td>${a.description}</td>
+  const loaded = new Map();
+  await fetchPages('/assignments/', async res => {
+    const page = await res.json();
+    page.forEach(a => loaded.set(a.id, a));
+    return page;
+  });
+  assignments.clear();
+  loaded.forEach((a, id) => assignments.set(id, a));
+  renderAll();
+}
+
+function assignmentRowHtml(id, i) {
+  const a = assignments.get(id);
+  const due = a.due_date ? new Date(a.due_date).toLocaleString() : '';
+  return `<tr id="assignment-row-${id}"${i % 2 ? ' class="alt"' : ''}>
+      <td>${id}</td>
+      <td>${escapeHtml(a.title)}</td>
+      <td>${escapeHtml(a.description || '')}</td>
       <td>${due}</td>
-      <td>
-        <button onclick="deleteAssignment(${a.id})">Delete</button>
-      </td>
+      <td><button data-delete="${id}">Delete</button></td>
     </tr>`;
-    tbody.innerHTML += row;
-  });
 }
 
 async function deleteAssignment(id) {
   if (!confirm('Are you sure you want to delete this assignment?')) return;
   const res = await fetch(`/assignments/${id}`, { method: 'DELETE' });
   if (res.ok) {
-    fetchAssignments();
-    fetchMatrix();
+    syncChanges();
   } else {
     alert('Failed to delete assignment');
   }
 }
 
+document.getElementById('assignmentsTable').addEventListener('click', e => {
+  const button = e.target.closest('button[data-delete]');
+  if (button) deleteAssignment(Number(button.dataset.delete));
+});
+
 document.getElementById('assignmentForm').onsubmit = async (e) => {
   e.preventDefault();
   const data = {
@@ -136,8 +294,7 @@ document.getElementById('assignmentForm').onsubmit = async (e) => {
   if (res.ok) {
     result.textContent = 'Assignment created!';
     result.className = 'result';
-    fetchAssignments();
-    fetchMatrix();
+    syncChanges();
   } else {
     result.textContent = 'Error';
     result.className = 'result error';
@@ -145,62 +302,180 @@ document.getElementById('assignmentForm').onsubmit = async (e) => {
 };
 
 // --- Student-Assignment Matrix ---
+// Loads the matrix a page of students at a time and shows each page as it
+// arrives, so the first rows appear without waiting for the whole class.
 async function fetchMatrix() {
-  const [studentsRes, assignmentsRes, submissionsRes] = await Promise.all([
-    fetch('/students/'),
-    fetch('/assignments/'),
-    fetch('/submissions/')
-  ]);
-  const students = await studentsRes.json();
-  const assignments = await assignmentsRes.json();
-  const submissions = await submissionsRes.json();
-
-  // Build header
-  const headerRow = document.getElementById('matrixHeader');
-  headerRow.innerHTML = '<th>Student</th><th>Email</th>';
-  assignments.forEach(a => {
-    headerRow.innerHTML += `<th>${a.title}</th>`;
+  let first = true;
+  await fetchPages('/matrix', async res => {
+    const page = await res.json();
+    if (first) {
+      // Changes after the first page's cursor are replayed; that is harmless.
+      changeCursor = Number(res.headers.get('X-Change-Cursor')) || 0;
+      students.clear();
+      submitted.clear();
+      first = false;
+    }
+    const ids = new Set(page.assignments.map(a => a.id));
+    [...assignments.keys()].forEach(id => { if (!ids.has(id)) assignments.delete(id); });
+    page.assignments.forEach(a => assignments.set(a.id, { ...assignments.get(a.id), ...a }));
+    page.students.forEach((s, i) => {
+      students.set(s.id, s);
+      submitted.set(s.id, new Set(page.submitted[i]));
+    });
+    renderAll();
+    return page.students;
   });
+}
 
-  // Build body
-  const tbody = document.getElementById('matrixTable').querySelector('tbody');
-  tbody.innerHTML = '';
-  students.forEach(student => {
-    let row = `<tr><td>${student.name}</td><td>${student.email}</td>`;
-    assignments.forEach(assignment => {
-      const submitted = submissions.some(
-        s => s.student_id === student.id && s.assignment_id === assignment.id
-      );
-      row += `<td>
-        <input type="checkbox" 
-          data-student="${student.id}" 
-          data-assignment="${assignment.id}" 
-          ${submitted ? 'checked' : ''}>
-      </td>`;
-    });
-    row += '</tr>';
-    tbody.innerHTML += row;
+let matrixColumns = '';
+
+function renderMatrixHeader() {
+  const columns = [...assignments.keys()].join(',');
+  if (columns === matrixColumns) return;
+  matrixColumns = columns;
+  let html = '<th>Student</th><th>Email</th>';
+  assignments.forEach(a => { html += `<th>${escapeHtml(a.title)}</th>`; });
+  document.getElementById('matrixHeader').replaceChildren(fragment(html));
+}
+
+function matrixRowHtml(id, i) {
+  const s = students.get(id);
+  const done = submitted.get(id) || new Set();
+  let row = `<tr id="matrix-row-${id}"${i % 2 ? ' class="alt"' : ''}><td>${escapeHtml(s.name)}</td><td>${escapeHtml(s.email)}</td>`;
+  assignments.forEach((a, assignmentId) => {
+    row += `<td><input type="checkbox" data-student="${id}" data-assignment="${assignmentId}"${done.has(assignmentId) ? ' checked' : ''}></td>`;
   });
+  return row + '</tr>';
+}
 
-  // Add event listeners to checkboxes
-  document.querySelectorAll('#matrixTable input[type="checkbox"]').forEach(cb => {
-    cb.onchange = async function() {
-      const student_id = this.getAttribute('data-student');
-      const assignment_id = this.getAttribute('data-assignment');
-      const url = `/submissions/?student_id=${student_id}&assignment_id=${assignment_id}`;
-      const res = this.checked
-        ? await fetch(url, { method: 'POST' })
-        : await fetch(url, { method: 'DELETE' });
-      if (!res.ok) {
-        alert('Failed to update submission');
-        this.checked = !this.checked;
+// One listener on the table handles every checkbox, including ones rendered later.
+document.getElementById('matrixTable').addEventListener('change', e => {
+  if (e.target.matches('input[type="checkbox"]')) queueSubmissionToggle(e.target);
+});
+
+// --- Change feed ---
+// The dashboard loads everything once, then applies the rows changed since
+// changeCursor: from GET /changes after our own edits, and from the
+// /changes/stream event source for everyone else's. Applying a change twice is
+// harmless, so a change racing the initial load is simply replayed.
+let changeCursor = 0;
+let changeStream = null;
+
+function setSubmitted(studentId, assignmentId, checked) {
+  const done = submitted.get(studentId);
+  if (!done) return;
+  if (checked) done.add(assignmentId); else done.delete(assignmentId);
+}
+
+function applyChanges(changes) {
+  changes.forEach(c => {
+    if (c.id <= changeCursor) return;
+    const { data } = c;
+    if (c.entity === 'student') {
+      if (c.op === 'delete') {
+        students.delete(data.id);
+        submitted.delete(data.id);
+        if (editing && editing.id === data.id) editing = null;
+      } else {
+        students.set(data.id, data);
+        if (!submitted.has(data.id)) submitted.set(data.id, new Set());
+      }
+    } else if (c.entity === 'assignment') {
+      if (c.op === 'delete') {
+        assignments.delete(data.id);
+        submitted.forEach(done => done.delete(data.id));
+      } else {
+        assignments.set(data.id, data);
       }
-    };
+    } else if (!pendingToggles.has(`${data.student_id}:${data.assignment_id}`)) {
+      // A toggle still waiting to be sent wins over the server's copy.
+      setSubmitted(data.student_id, data.assignment_id, c.op !== 'delete');
+    }
+    changeCursor = c.id;
   });
+  if (changes.length) renderAll();
+}
+
+async function reloadAll() {
+  await fetchMatrix();
+  await fetchAssignments();
+}
+
+async function syncChanges() {
+  for (;;) {
+    const res = await fetchRetrying(`/changes?since=${changeCursor}`);
+    if (res.status === 410) return reloadAll();
+    if (!res.ok) throw new Error(`GET /changes failed with ${res.status}`);
+    const feed = await res.json();
+    applyChanges(feed.changes);
+    if (feed.changes.length < 1000) return;
+  }
+}
+
+function openChangeStream() {
+  if (!window.EventSource) return;
+  if (changeStream) changeStream.close();
+  changeStream = new EventSource(`/changes/stream?since=${changeCursor}`);
+  changeStream.addEventListener('changes', e => applyChanges(JSON.parse(e.data)));
+  changeStream.addEventListener('reset', loadDashboard);
+}
+
+// Loads everything, then follows the change stream. If the load fails, the
+// user is told and the stream stays closed, rather than applying deltas to
+// a partial state.
+async function loadDashboard() {
+  if (changeStream) changeStream.close();
+  try {
+    await reloadAll();
+  } catch (e) {
+    alert(`Failed to load the dashboard (${e.message}). Reload the page to try again.`);
+    return;
+  }
+  openChangeStream();
+}
+
+// Checkbox toggles update the state at once and are batched into a single
+// POST /submissions/bulk call.
+const pendingToggles = new Map();
+let toggleTimer = null;
+
+function queueSubmissionToggle(cb) {
+  const student_id = Number(cb.dataset.student);
+  const assignment_id = Number(cb.dataset.assignment);
+  setSubmitted(student_id, assignment_id, cb.checked);
+  pendingToggles.set(`${student_id}:${assignment_id}`, { student_id, assignment_id, op: cb.checked ? 'add' : 'remove' });
+  clearTimeout(toggleTimer);
+  toggleTimer = setTimeout(flushSubmissionToggles, 300);
+}
+
+async function flushSubmissionToggles() {
+  const batch = [...pendingToggles.values()];
+  pendingToggles.clear();
+  if (!batch.length) return;
+  let ok = false;
+  try {
+    const res = await fetch('/submissions/bulk', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify(batch)
+    });
+    ok = res.ok;
+  } catch (e) {
+    ok = false;
+  }
+  if (!ok) {
+    alert('Failed to update submission');
+    // Revert only the cells still showing what was sent: a cell toggled again
+    // since, or updated by the change feed, keeps its newer state.
+    batch.forEach(op => {
+      const sent = op.op === 'add';
+      const done = submitted.get(op.student_id);
+      if (done && done.has(op.assignment_id) === sent && !pendingToggles.has(`${op.student_id}:${op.assignment_id}`)) {
+        setSubmitted(op.student_id, op.assignment_id, !sent);
+      }
+    });
+    matrixTable.schedule();
+  }
 }
 
-window.onload = function() {
-  fetchStudents();
-  fetchAssignments();
-  fetchMatrix();
-};
\ No newline at end of file
+window.onload = loadDashboard;
@@ -1,9 +1,11 @@
+import os
 import pytest
-from app import crud, schemas, models
+from contextlib import contextmanager
+from app import crud, database, schemas, models
 from app.database import Base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Use a separate test database (SQLite in-memory for isolation)
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -78,4 +80,287 @@ def test_get_all_students_assignments_submissions(db):
     assert crud.delete_submission(db, getattr(s, "id"), getattr(a, "id")) is None
     assert deleted is not None
     # Should not find submission after delete
-    assert crud.delete_submission(db, getattr(s, "id"), getattr(a, "id")) is None
\ No newline at end of file
+    assert crud.delete_submission(db, getattr(s, "id"), getattr(a, "id")) is None
+
+def test_get_submission_matrix(db):
+    s1 = crud.create_student(db, schemas.StudentCreate(name="M1", email="m1@x.com"))
+    s2 = crud.create_student(db, schemas.StudentCreate(name="M2", email="m2@x.com"))
+    a1 = crud.create_assignment(db, schemas.AssignmentCreate(title="MA1", description="D", due_date=datetime.fromisoformat("2025-06-30T23:59:00")))
+    a2 = crud.create_assignment(db, schemas.AssignmentCreate(title="MA2", description="D", due_date=datetime.fromisoformat("2025-06-30T23:59:00")))
+    crud.create_submission(db, s1.id, a2.id)
+    crud.create_submission(db, s1.id, a1.id)
+    matrix = crud.get_submission_matrix(db)
+    assert [s.id for s in matrix["students"]] == [s1.id, s2.id]
+    assert [a.id for a in matrix["assignments"]] == [a1.id, a2.id]
+    assert matrix["submitted"] == [[a1.id, a2.id], []]
+    page = crud.get_submission_matrix(db, limit=1, after=s1.id)
+    assert [s.id for s in page["students"]] == [s2.id] and page["submitted"] == [[]]
+    assert len(page["assignments"]) == 2
+    assert crud.get_submission_matrix(db, limit=1, after=s2.id)["students"] == []
+
+def test_get_all_students_keyset_pagination(db):
+    created = [crud.create_student(db, schemas.StudentCreate(name=f"P{i}", email=f"p{i}@x.com")) for i in range(5)]
+    first = crud.get_all_students(db, limit=2)
+    assert [s.id for s in first] == [created[0].id, created[1].id]
+    second = crud.get_all_students(db, limit=2, after=first[-1].id)
+    assert [s.id for s in second] == [created[2].id, created[3].id]
+    rest = crud.get_all_students(db, limit=2, after=second[-1].id)
+    assert [s.id for s in rest] == [created[4].id]
+    assert [s.id for s in crud.iter_rows(db, models.Student, after=created[2].id, batch_size=1)] == [created[3].id, created[4].id]
+
+def test_bulk_update_submissions(db):
+    s1 = crud.create_student(db, schemas.StudentCreate(name="B1", email="b1@x.com"))
+    s2 = crud.create_student(db, schemas.StudentCreate(name="B2", email="b2@x.com"))
+    a = crud.create_assignment(db, schemas.AssignmentCreate(title="BA", description="D", due_date=datetime.fromisoformat("2025-06-30T23:59:00")))
+    crud.create_submission(db, s1.id, a.id)
+    results = crud.bulk_update_submissions(db, [
+        schemas.SubmissionOp(student_id=s1.id, assignment_id=a.id, op="add"),
+        schemas.SubmissionOp(student_id=s2.id, assignment_id=a.id, op="add"),
+    ])
+    assert [r["status"] for r in results] == ["exists", "created"]
+    assert all(sub.submitted_at is not None for sub in crud.get_all_submissions(db))
+    results = crud.bulk_update_submissions(db, [
+        schemas.SubmissionOp(student_id=s1.id, assignment_id=a.id, op="remove"),
+        schemas.SubmissionOp(student_id=s2.id, assignment_id=a.id, op="add"),
+        schemas.SubmissionOp(student_id=s2.id, assignment_id=a.id, op="remove"),
+        schemas.SubmissionOp(student_id=s2.id, assignment_id=a.id + 1, op="remove"),
+    ])
+    assert [r["status"] for r in results] == ["deleted", "deleted", "not_found"]
+    assert crud.get_all_submissions(db) == []
+
+def test_import_students(db):
+    crud.create_student(db, schemas.StudentCreate(name="Existing", email="i0@x.com"))
+    students = [schemas.StudentCreate(name=f"I{i}", email=f"i{i}@x.com") for i in range(3)]
+    students.append(schemas.StudentCreate(name="Again", email="i1@x.com"))
+    assert crud.import_students(db, students) == 2
+    assert len(crud.get_all_students(db)) == 3
+
+def test_summary_counters_follow_writes(db):
+    s1 = crud.create_student(db, schemas.StudentCreate(name="C1", email="c1@x.com"))
+    s2 = crud.create_student(db, schemas.StudentCreate(name="C2", email="c2@x.com"))
+    a1 = crud.create_assignment(db, schemas.AssignmentCreate(title="CA1", description="D", due_date=datetime.fromisoformat("2025-06-30T23:59:00")))
+    a2 = crud.create_assignment(db, schemas.AssignmentCreate(title="CA2", description="D", due_date=datetime.fromisoformat("2025-06-30T23:59:00")))
+    crud.create_submission(db, s1.id, a1.id)
+    crud.create_submission(db, s1.id, a1.id)
+    crud.bulk_update_submissions(db, [
+        schemas.SubmissionOp(student_id=s2.id, assignment_id=a1.id, op="add"),
+        schemas.SubmissionOp(student_id=s1.id, assignment_id=a2.id, op="add"),
+    ])
+    crud.delete_submission(db, s2.id, a1.id)
+    assert crud.get_assignment_summary(db, a1.id).submitted_count == 1
+    assert crud.get_assignment_summary(db, a2.id).submitted_count == 1
+    assert crud.get_student_summary(db, s1.id).completed_count == 2
+    assert crud.get_student_summary(db, s2.id).completed_count == 0
+    crud.delete_assignment(db, a2.id)
+    assert crud.get_assignment_summary(db, a2.id) is None
+    assert crud.get_student_summary(db, s1.id).completed_count == 1
+    before = [(s.student_id, s.completed_count) for s in crud.get_student_summaries(db)]
+    crud.rebuild_summaries(db)
+    db.expire_all()
+    assert [(s.student_id, s.completed_count) for s in crud.get_student_summaries(db)] == before
+    assert [(a.assignment_id, a.submitted_count) for a in crud.get_assignment_summaries(db)] == [(a1.id, 1)]
+
+def test_counter_decrement_never_creates_negative_rows(db):
+    # A submission made before the summary tables existed has no counters.
+    crud._adjust_summaries(db, [(1, 1), (2, 1)], -1)
+    db.commit()
+    assert db.query(models.StudentSummary).count() == 0 and db.query(models.AssignmentSummary).count() == 0
+
+def test_create_schema_backfills_new_summary_tables(db):
+    s = crud.create_student(db, schemas.StudentCreate(name="B", email="b@x.com"))
+    a = crud.create_assignment(db, schemas.AssignmentCreate(title="BA", description="D", due_date=datetime.fromisoformat("2025-06-30T23:59:00")))
+    crud.create_submission(db, s.id, a.id)
+    # An existing database upgraded to a version with counters.
+    models.StudentSummary.__table__.drop(engine)
+    models.AssignmentSummary.__table__.drop(engine)
+    models.create_schema(engine)
+    assert crud.get_student_summary(db, s.id).completed_count == 1
+    assert crud.get_assignment_summary(db, a.id).submitted_count == 1
+
+def test_bulk_delete_students_and_assignments(db):
+    s1, s2, s3 = [crud.create_student(db, schemas.StudentCreate(name=f"D{i}", email=f"d{i}@x.com")) for i in range(3)]
+    a1, a2 = [crud.create_assignment(db, schemas.AssignmentCreate(title=f"DA{i}", description="D", due_date=datetime.fromisoformat("2025-06-30T23:59:00"))) for i in range(2)]
+    for s in (s1, s2, s3):
+        crud.create_submission(db, s.id, a1.id)
+    crud.create_submission(db, s1.id, a2.id)
+    assert crud.delete_students(db, [s1.id, s2.id, 99999]) == [s1.id, s2.id]
+    assert [s.id for s in crud.get_all_students(db)] == [s3.id]
+    assert crud.get_assignment_summary(db, a1.id).submitted_count == 1
+    assert crud.get_assignment_summary(db, a2.id).submitted_count == 0
+    assert crud.get_student_summary(db, s1.id) is None
+    assert crud.delete_assignments(db, [a1.id, a2.id]) == [a1.id, a2.id]
+    assert crud.get_all_assignments(db) == []
+    assert crud.get_all_submissions(db) == []
+    assert crud.get_student_summary(db, s3.id).completed_count == 0
+    assert crud.delete_assignments(db, []) == []
+
+def test_change_log_records_writes(db):
+    s = crud.create_student(db, schemas.StudentCreate(name="L", email="l@x.com"))
+    a = crud.create_assignment(db, schemas.AssignmentCreate(title="LA", description="D", due_date=datetime.fromisoformat("2025-06-30T23:59:00")))
+    cursor = crud.latest_change_id(db)
+    crud.update_student(db, s.id, schemas.StudentUpdate(name="L2"))
+    crud.bulk_update_submissions(db, [schemas.SubmissionOp(student_id=s.id, assignment_id=a.id, op="add")])
+    crud.delete_assignment(db, a.id)
+    feed = crud.get_changes(db, cursor)
+    assert [(c.entity, c.op) for c in feed["changes"]] == [("student", "update"), ("submission", "insert"), ("assignment", "delete")]
+    assert feed["changes"][0].data == {"id": s.id, "name": "L2", "email": "l@x.com"}
+    assert feed["changes"][1].data["submitted_at"]
+    assert feed["cursor"] == crud.latest_change_id(db)
+    assert crud.get_changes(db, feed["cursor"]) == {"cursor": feed["cursor"], "changes": []}
+    db.query(models.Change).update({"created_at": datetime(2000, 1, 1)})
+    db.commit()
+    assert crud.prune_changes(db, timedelta(days=1)) == 4
+    assert crud.get_changes(db, cursor) is None
+    assert crud.get_changes(db, feed["cursor"] - 1)["changes"][0].id == feed["cursor"]
+
+def test_students_completed_and_pending_pagination_and_counts(db):
+    students = [crud.create_student(db, schemas.StudentCreate(name=f"Q{i}", email=f"q{i}@x.com")) for i in range(5)]
+    a = crud.create_assignment(db, schemas.AssignmentCreate(title="QA", description="D", due_date=datetime.fromisoformat("2025-06-30T23:59:00")))
+    for s in students[::2]:
+        crud.create_submission(db, s.id, a.id)
+    assert [s.id for s in crud.get_students_completed(db, a.id)] == [students[0].id, students[2].id, students[4].id]
+    assert [s.id for s in crud.get_students_completed(db, a.id, limit=2, after=students[0].id)] == [students[2].id, students[4].id]
+    assert [s.id for s in crud.get_students_pending(db, a.id, limit=1)] == [students[1].id]
+    assert [s.id for s in crud.get_students_pending(db, a.id, after=students[1].id)] == [students[3].id]
+    assert crud.count_students_completed(db, a.id) == 3
+    assert crud.count_students_pending(db, a.id) == 2
+
+def _explain(db, query):
+    sql = str(query.statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN " if db.get_bind().dialect.name == "sqlite" else "EXPLAIN "
+    return "\n".join(" ".join(map(str, row)) for row in db.execute(text(prefix + sql)))
+
+def test_status_queries_use_submission_index_sqlite(db):
+    plan = _explain(db, db.query(models.Student).filter(~crud._has_submitted(1)))
+    assert "LIST SUBQUERY" not in plan and "SCAN submissions" not in plan
+    assert "SEARCH submissions USING COVERING INDEX" in plan
+    plan = _explain(db, db.query(models.Student).filter(crud._has_submitted(1)))
+    assert "SEARCH submissions USING COVERING INDEX" in plan
+
+@pytest.mark.skipif(not os.getenv("DATABASE_URL", "").startswith("postgresql"), reason="needs a PostgreSQL DATABASE_URL")
+def test_pending_query_is_anti_join_postgresql():
+    pg_engine = create_engine(os.environ["DATABASE_URL"])
+    Base.metadata.create_all(bind=pg_engine)
+    with sessionmaker(bind=pg_engine)() as pg_db:
+        plan = _explain(pg_db, pg_db.query(models.Student).filter(~crud._has_submitted(1)))
+        assert "Anti Join" in plan
+        plan = _explain(pg_db, pg_db.query(models.Student).filter(crud._has_submitted(1)))
+        assert "SubPlan" not in plan
+    pg_engine.dispose()
+
+@pytest.mark.skipif(not os.getenv("DATABASE_URL", "").startswith("postgresql"), reason="needs a PostgreSQL DATABASE_URL")
+def test_changes_wait_out_visibility_lag_postgresql(monkeypatch):
+    pg_engine = create_engine(os.environ["DATABASE_URL"])
+    Base.metadata.create_all(bind=pg_engine)
+    with sessionmaker(bind=pg_engine)() as pg_db:
+        since = crud.latest_change_id(pg_db)
+        crud.create_student(pg_db, schemas.StudentCreate(name="Lag", email=f"lag{since}@x.com"))
+        monkeypatch.setattr(crud, "CHANGES_VISIBILITY_LAG", 60)
+        assert crud.get_changes(pg_db, since)["changes"] == []
+        monkeypatch.setattr(crud, "CHANGES_VISIBILITY_LAG", 0)
+        assert [c.op for c in crud.get_changes(pg_db, since)["changes"]] == ["insert"]
+    pg_engine.dispose()
+
+@contextmanager
+def count_queries():
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+def test_single_writes_are_one_round_trip(db):
+    due = datetime.fromisoformat("2025-06-30T23:59:00")
+    with count_queries() as q:
+        s = crud.create_student(db, schemas.StudentCreate(name="W", email="w@x.com"))
+    assert len(q) == 2 and s.name == "W"
+    with count_queries() as q:
+        assert crud.create_student(db, schemas.StudentCreate(name="W2", email="w@x.com")) is None
+    assert len(q) == 1
+    with count_queries() as q:
+        a = crud.create_assignment(db, schemas.AssignmentCreate(title="WA", description="D", due_date=due))
+    assert len(q) == 2 and a.title == "WA"
+    with count_queries() as q:
+        updated = crud.update_student(db, s.id, schemas.StudentUpdate(name="W renamed"))
+    assert len(q) == 2 and updated.name == "W renamed" and updated.email == "w@x.com"
+    with count_queries() as q:
+        assert crud.update_student(db, 99999, schemas.StudentUpdate(name="Nobody")) is None
+    assert len(q) == 1
+    # Each write that changes a row also appends to the change log, and
+    # submission writes add the two counter upserts.
+    with count_queries() as q:
+        sub = crud.create_submission(db, s.id, a.id)
+    assert len(q) == 4 and sub.submitted_at is not None
+    with count_queries() as q:
+        assert crud.create_submission(db, s.id, a.id).id == sub.id
+    assert len(q) == 2
+    with count_queries() as q:
+        assert crud.delete_submission(db, s.id, a.id).id == sub.id
+    assert len(q) == 4
+    crud.create_submission(db, s.id, a.id)
+    with count_queries() as q:
+        assert crud.delete_assignment(db, a.id).id == a.id
+    assert len(q) == 5
+    assert crud.get_student_summary(db, s.id).completed_count == 0
+    assert crud.get_all_submissions(db) == []
+
+def test_submission_analytics(db):
+    due = datetime(2025, 6, 30, 12, 0)
+    a = crud.create_assignment(db, schemas.AssignmentCreate(title="AN", description="D", due_date=due))
+    empty = crud.create_assignment(db, schemas.AssignmentCreate(title="AN2", description="D", due_date=due))
+    offsets = [-30, -6, -5, -1, 2]  # hours relative to the deadline
+    for i, hours in enumerate(offsets):
+        s = crud.create_student(db, schemas.StudentCreate(name=f"AN{i}", email=f"an{i}@x.com"))
+        db.add(models.Submission(student_id=s.id, assignment_id=a.id, submitted_at=due + timedelta(hours=hours)))
+    db.commit()
+    by_day, none = crud.get_submission_analytics(db, [a.id, empty.id], "day")
+    assert (by_day["total"], by_day["on_time"], by_day["late"]) == (5, 4, 1)
+    assert [(b["start"], b["count"]) for b in by_day["buckets"]] == [(datetime(2025, 6, 29), 1), (datetime(2025, 6, 30), 4)]
+    assert [round(by_day["lead_time_hours"][p], 6) for p in ("p50", "p90", "p99")] == [5, 30, 30]
+    assert (none["total"], none["buckets"], none["lead_time_hours"]["p50"]) == (0, [], None)
+    by_hour, = crud.get_submission_analytics(db, [a.id], "hour")
+    assert [b["start"] for b in by_hour["buckets"]][-2:] == [datetime(2025, 6, 30, 11), datetime(2025, 6, 30, 14)]
+    assert crud.get_assignment_ids(db) == [a.id, empty.id]
+
+def test_analytics_uses_submitted_at_index_sqlite(db):
+    query = db.query(models.Submission.submitted_at).filter(models.Submission.assignment_id == 1)
+    assert "USING COVERING INDEX ix_submissions_assignment_submitted" in _explain(db, query)
+
+def test_replica_reads_are_routed():
+    primary, replica = create_engine("sqlite://"), create_engine("sqlite://")
+    for e in (primary, replica):
+        Base.metadata.create_all(bind=e)
+    RoutedSession = sessionmaker(class_=database.routing_session(primary, [replica]), autoflush=False)
+    with sessionmaker(bind=replica)() as seed:
+        crud.create_student(seed, schemas.StudentCreate(name="On replica", email="r@x.com"))
+    with RoutedSession() as db:
+        assert [s.email for s in crud.get_all_students(db)] == ["r@x.com"]
+        # Reads that are not marked, and every read after a write, use the primary.
+        assert crud.get_changes(db)["changes"] == []
+        crud.create_student(db, schemas.StudentCreate(name="On primary", email="p@x.com"))
+        assert [s.email for s in crud.get_all_students(db)] == ["p@x.com"]
+    with RoutedSession() as db:
+        token = database.primary_only.set(True)
+        try:
+            assert [s.email for s in crud.get_all_students(db)] == ["p@x.com"]
+        finally:
+            database.primary_only.reset(token)
+    primary.dispose()
+    replica.dispose()
+
+def test_pool_per_worker():
+    from app.manage import pool_per_worker
+    assert pool_per_worker(40, 4) == 10
+    assert pool_per_worker(10, 3) == 3
+    with pytest.raises(SystemExit):
+        pool_per_worker(2, 4)
+
+def test_create_schema_adds_indexes_to_existing_tables(db):
+    # A database created before the index existed.
+    db.execute(text("DROP INDEX ix_submissions_assignment_student"))
+    db.commit()
+    models.create_schema(engine)
+    names = {row[0] for row in db.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'submissions'"))}
+    assert {"ix_submissions_assignment_student", "ix_submissions_assignment_submitted"} <= names
@@ -1,13 +1,31 @@
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+from datetime import datetime
 import pytest
 from fastapi.testclient import TestClient
+from app import main
 from app.main import app
-from app.database import Base, engine
+from app import cache, compression, crud_async, database, instrumentation, manage, models, ratelimit
+from app.database import Base, get_async_db, get_session
+from sqlalchemy import bindparam, inspect, select, text
 from sqlalchemy.orm import sessionmaker
 
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The engine is created on first use, inside a fixture, so collecting the
+# tests needs no DATABASE_URL.
+@pytest.fixture(scope="module")
+def engine():
+    return database.engine
+
+@pytest.fixture(scope="module")
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 @pytest.fixture(scope="module")
-def client():
+def client(engine):
     # Create tables before tests
     Base.metadata.create_all(bind=engine)
     with TestClient(app) as c:
@@ -126,6 +144,18 @@ def test_delete_assignment(client):
     assignments = resp.json()
     assert not any(a["id"] == assignment["id"] for a in assignments)
 
+def test_bulk_delete_endpoints(client):
+    students = [client.post("/students/", json={"name": f"BD{i}", "email": f"bd{i}@example.com"}).json() for i in range(2)]
+    a = client.post("/assignments/", json={"title": "BulkDel", "description": "Desc", "due_date": "2025-07-10T12:00:00"}).json()
+    client.post("/submissions/", json={"student_id": students[0]["id"], "assignment_id": a["id"]})
+    resp = client.post("/students/bulk-delete", json={"ids": [s["id"] for s in students]})
+    assert resp.status_code == 200
+    assert resp.json() == {"deleted": sorted(s["id"] for s in students)}
+    assert client.get(f"/summary/assignments/{a['id']}").json()["submitted_count"] == 0
+    resp = client.post("/assignments/bulk-delete", json={"ids": [a["id"], 99999]})
+    assert resp.json() == {"deleted": [a["id"]]}
+    assert not any(x["id"] == a["id"] for x in client.get("/assignments/").json())
+
 def test_create_student_duplicate_email_error(client):
     # Create a student
     resp = client.post("/students/", json={"name": "Dup", "email": "dup@example.com"})
@@ -138,4 +168,468 @@ def test_create_student_duplicate_email_error(client):
 def test_delete_nonexistent_assignment(client):
     resp = client.delete("/assignments/99999")
     assert resp.status_code == 404
-    assert resp.json()["detail"] == "Assignment not found"
\ No newline at end of file
+    assert resp.json()["detail"] == "Assignment not found"
+
+def test_create_submission_conflict_lost(client, monkeypatch):
+    # The insert hit a conflict but the existing row was gone by the read back.
+    async def lost(db, student_id, assignment_id):
+        return None
+    monkeypatch.setattr(crud_async, "create_submission", lost)
+    resp = client.post("/submissions/?student_id=1&assignment_id=1")
+    assert resp.status_code == 409
+
+def test_submission_matrix(client):
+    s = client.post("/students/", json={"name": "Matrix", "email": "matrix@example.com"}).json()
+    a = client.post("/assignments/", json={
+        "title": "Matrix Assignment",
+        "description": "Desc",
+        "due_date": "2025-07-04T12:00:00"
+    }).json()
+    client.post(f"/submissions/?student_id={s['id']}&assignment_id={a['id']}")
+    resp = client.get("/matrix")
+    assert resp.status_code == 200
+    matrix = resp.json()
+    assert any(x["id"] == a["id"] for x in matrix["assignments"])
+    i = [x["id"] for x in matrix["students"]].index(s["id"])
+    assert a["id"] in matrix["submitted"][i]
+    page = client.get(f"/matrix?limit=1&after={s['id'] - 1}").json()
+    assert [x["id"] for x in page["students"]] == [s["id"]] and a["id"] in page["submitted"][0]
+    assert client.get("/matrix?limit=0").status_code == 422
+
+def test_list_students_pagination_and_stream(client):
+    for i in range(3):
+        client.post("/students/", json={"name": f"Page{i}", "email": f"page{i}@example.com"})
+    all_ids = [s["id"] for s in client.get("/students/").json()]
+    resp = client.get("/students/?limit=2")
+    assert resp.status_code == 200
+    assert [s["id"] for s in resp.json()] == all_ids[:2]
+    cursor = resp.headers["X-Next-Cursor"]
+    resp = client.get(f"/students/?limit=2&after={cursor}")
+    assert [s["id"] for s in resp.json()] == all_ids[2:4]
+    resp = client.get("/students/?stream=true")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    streamed = [json.loads(line) for line in resp.text.splitlines()]
+    assert [s["id"] for s in streamed] == all_ids
+
+def test_bulk_update_submissions(client):
+    s = client.post("/students/", json={"name": "Bulk", "email": "bulk@example.com"}).json()
+    a = client.post("/assignments/", json={
+        "title": "Bulk Assignment",
+        "description": "Desc",
+        "due_date": "2025-07-05T12:00:00"
+    }).json()
+    resp = client.post("/submissions/bulk", json=[
+        {"student_id": s["id"], "assignment_id": a["id"], "op": "add"},
+    ])
+    assert resp.status_code == 200
+    assert resp.json()[0]["status"] == "created"
+    completed = client.get(f"/students/completed/{a['id']}").json()
+    assert any(stu["id"] == s["id"] for stu in completed)
+    resp = client.post("/submissions/bulk", json=[
+        {"student_id": s["id"], "assignment_id": a["id"], "op": "remove"},
+    ])
+    assert resp.json()[0]["status"] == "deleted"
+    resp = client.post("/submissions/bulk", json=[
+        {"student_id": s["id"], "assignment_id": a["id"], "op": "toggle"},
+    ])
+    assert resp.status_code == 422
+
+def test_import_students_csv_and_ndjson(client):
+    client.post("/students/", json={"name": "Imported", "email": "imp0@example.com"})
+    body = "name,email\r\nImp0,imp0@example.com\r\nImp1,imp1@example.com\r\nBad,not-an-email\r\nImp2,imp2@example.com\r\nImp1 again,imp1@example.com\r\n"
+    resp = client.post("/students/import", content=body, headers={"Content-Type": "text/csv"})
+    assert resp.status_code == 200
+    assert resp.json() == {"inserted": 2, "duplicates": 2, "invalid": 1}
+    body = '{"name": "Imp3", "email": "imp3@example.com"}\n{"name": "Imp4"}\nnot json\n'
+    resp = client.post("/students/import", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert resp.json() == {"inserted": 1, "duplicates": 0, "invalid": 2}
+    emails = {s["email"] for s in client.get("/students/").json()}
+    assert {"imp1@example.com", "imp2@example.com", "imp3@example.com"} <= emails
+    # A quoted field may span lines; an unterminated one is invalid.
+    body = 'name,email\n"Multi\nLine, ""Jr.""",multi@example.com\nImp5,imp5@example.com\n"Open,open@example.com\n'
+    resp = client.post("/students/import", content=body, headers={"Content-Type": "text/csv"})
+    assert resp.json() == {"inserted": 2, "duplicates": 0, "invalid": 1}
+    names = {s["email"]: s["name"] for s in client.get("/students/").json()}
+    assert names["multi@example.com"] == 'Multi\nLine, "Jr."' and names["imp5@example.com"] == "Imp5"
+
+def test_async_session_stack(client, monkeypatch):
+    app.dependency_overrides[get_session] = get_async_db
+    monkeypatch.setattr(database, "USE_ASYNC_DB", True)
+    try:
+        resp = client.post("/students/", json={"name": "Async", "email": "async@example.com"})
+        assert resp.status_code == 200
+        student = resp.json()
+        resp = client.put(f"/students/{student['id']}", json={"name": "Async Updated"})
+        assert resp.json()["name"] == "Async Updated"
+        a = client.post("/assignments/", json={
+            "title": "Async Assignment",
+            "description": "Desc",
+            "due_date": "2025-07-06T12:00:00"
+        }).json()
+        client.post(f"/submissions/?student_id={student['id']}&assignment_id={a['id']}")
+        completed = client.get(f"/students/completed/{a['id']}").json()
+        assert [s["id"] for s in completed] == [student["id"]]
+        streamed = [json.loads(line) for line in client.get("/students/?stream=true").text.splitlines()]
+        assert student["id"] in [s["id"] for s in streamed]
+    finally:
+        app.dependency_overrides.clear()
+
+def test_pool_metrics(client):
+    client.get("/students/")
+    resp = client.get("/metrics/pool")
+    assert resp.status_code == 200
+    sync = resp.json()["sync"]
+    assert sync["checkout_ms"]["count"] >= 1
+    assert sync["checkout_ms"]["buckets"]["+Inf"] == sync["checkout_ms"]["count"]
+    assert {"size", "in_use", "overflow", "timeouts"} <= sync.keys()
+
+def test_summary_endpoints(client):
+    s = client.post("/students/", json={"name": "Summary", "email": "summary@example.com"}).json()
+    a = client.post("/assignments/", json={
+        "title": "Summary Assignment",
+        "description": "Desc",
+        "due_date": "2025-07-07T12:00:00"
+    }).json()
+    assert client.get(f"/summary/assignments/{a['id']}").json()["submitted_count"] == 0
+    client.post(f"/submissions/?student_id={s['id']}&assignment_id={a['id']}")
+    assert client.get(f"/summary/assignments/{a['id']}").json() == {"assignment_id": a["id"], "submitted_count": 1}
+    assert client.get(f"/summary/students/{s['id']}").json() == {"student_id": s["id"], "completed_count": 1}
+    assert any(x["assignment_id"] == a["id"] for x in client.get("/summary/assignments").json())
+    assert client.get("/summary/students/99999").status_code == 404
+
+def test_students_pending_pagination_and_count_only(client):
+    a = client.post("/assignments/", json={
+        "title": "Paged Pending",
+        "description": "Desc",
+        "due_date": "2025-07-08T12:00:00"
+    }).json()
+    pending = [s["id"] for s in client.get(f"/students/pending/{a['id']}").json()]
+    assert pending == sorted(pending)
+    resp = client.get(f"/students/pending/{a['id']}?limit=1")
+    assert [s["id"] for s in resp.json()] == pending[:1]
+    resp = client.get(f"/students/pending/{a['id']}?limit=1&after={resp.headers['X-Next-Cursor']}")
+    assert [s["id"] for s in resp.json()] == pending[1:2]
+    assert client.get(f"/students/pending/{a['id']}?count_only=true").json() == {"count": len(pending)}
+    assert client.get(f"/students/completed/{a['id']}?count_only=true").json() == {"count": 0}
+
+class SharedBackendStandIn:
+    # Dict-backed stand-in for a shared (e.g. Redis) cache backend.
+    def __init__(self):
+        self.values, self.counters = {}, {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ttl):
+        self.values[key] = value
+
+    def get_counter(self, key):
+        return self.counters.get(key, 0)
+
+    def incr(self, key):
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+def test_read_cache_etag_and_invalidation(client):
+    backend = SharedBackendStandIn()
+    cache.configure(backend)
+    try:
+        a = client.post("/assignments/", json={
+            "title": "Cached",
+            "description": "Desc",
+            "due_date": "2025-07-09T12:00:00"
+        }).json()
+        resp = client.get(f"/students/pending/{a['id']}")
+        etag = resp.headers["ETag"]
+        cached_keys = len(backend.values)
+        resp = client.get(f"/students/pending/{a['id']}", headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert len(backend.values) == cached_keys
+        # A write to an unrelated assignment keeps the entry valid.
+        other = client.post("/assignments/", json={
+            "title": "Other",
+            "description": "Desc",
+            "due_date": "2025-07-09T12:00:00"
+        }).json()
+        s = client.post("/students/", json={"name": "Cache", "email": "cache@example.com"}).json()
+        resp = client.get(f"/students/pending/{a['id']}", headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert s["id"] in [x["id"] for x in resp.json()]
+        etag = resp.headers["ETag"]
+        client.post(f"/submissions/?student_id={s['id']}&assignment_id={other['id']}")
+        assert client.get(f"/students/pending/{a['id']}", headers={"If-None-Match": etag}).status_code == 304
+        client.post(f"/submissions/?student_id={s['id']}&assignment_id={a['id']}")
+        resp = client.get(f"/students/pending/{a['id']}", headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert s["id"] not in [x["id"] for x in resp.json()]
+    finally:
+        cache.configure(cache.MemoryBackend())
+
+def test_fast_json_matches_schema_serialization(client, monkeypatch):
+    s = client.post("/students/", json={"name": "Fast", "email": "fast@example.com"}).json()
+    a = client.post("/assignments/", json={
+        "title": "Fast Assignment",
+        "description": "Desc",
+        "due_date": "2025-07-10T08:30:00"
+    }).json()
+    client.post(f"/submissions/?student_id={s['id']}&assignment_id={a['id']}")
+    paths = ["/students/", "/assignments/", "/submissions/", f"/students/completed/{a['id']}", f"/students/pending/{a['id']}"]
+    bodies = {}
+    for fast in (True, False):
+        monkeypatch.setattr(main, "FAST_JSON", fast)
+        cache.configure(cache.MemoryBackend())
+        bodies[fast] = [client.get(path).json() for path in paths]
+    assert bodies[True] == bodies[False]
+    assert any(x["due_date"] == "2025-07-10T08:30:00" for x in bodies[True][1])
+
+def test_request_instrumentation(client, engine, monkeypatch):
+    cache.configure(cache.MemoryBackend())
+    resp = client.post("/students/", json={"name": "Timed", "email": "timed@example.com"})
+    assert 'desc="' in resp.headers["Server-Timing"]
+    resp = client.get("/students/")
+    timing = resp.headers["Server-Timing"]
+    assert "db;dur=" in timing and f'rows;desc="{len(resp.json())}"' in timing
+    for path, rows in (("/matrix", lambda body: len(body["students"])), ("/summary/students", len), ("/changes?since=0&limit=5", lambda body: len(body["changes"]))):
+        resp = client.get(path)
+        assert f'rows;desc="{rows(resp.json())}"' in resp.headers["Server-Timing"]
+    monkeypatch.setattr(instrumentation, "SLOW_QUERY_MS", 0)
+    client.get("/assignments/?limit=1")
+    metrics = client.get("/metrics").json()
+    route = metrics["routes"]["GET /students/"]
+    assert route["latency_ms"]["count"] >= 1
+    assert route["queries"]["sum"] >= 1
+    assert any(q["route"] == "GET /assignments/" for q in metrics["slow_queries"])
+    # Logged statements are truncated and carry placeholders, not values.
+    with engine.connect() as conn:
+        conn.execute(select(bindparam("email", "secret@example.com", literal_execute=True)))
+    assert "secret@example.com" not in instrumentation.slow_queries[-1]["statement"]
+    client.post("/students/import", content="name,email\n" + "".join(f"Slow {i},slow{i}@example.com\n" for i in range(50)), headers={"Content-Type": "text/csv"})
+    assert all(len(q["statement"]) <= instrumentation.SLOW_QUERY_MAX_CHARS + 3 for q in instrumentation.slow_queries)
+    assert "sync" in metrics["pool"]
+
+def test_change_feed(client):
+    cursor = int(client.get("/matrix").headers["X-Change-Cursor"])
+    s = client.post("/students/", json={"name": "Feed", "email": "feed@example.com"}).json()
+    a = client.post("/assignments/", json={"title": "Feed", "description": "Desc", "due_date": "2025-07-10T12:00:00"}).json()
+    client.post(f"/submissions/?student_id={s['id']}&assignment_id={a['id']}")
+    client.put(f"/students/{s['id']}", json={"name": "Feed Renamed"})
+    client.delete(f"/assignments/{a['id']}")
+    feed = client.get(f"/changes?since={cursor}").json()
+    assert [(c["entity"], c["op"]) for c in feed["changes"]] == [
+        ("student", "insert"), ("assignment", "insert"), ("submission", "insert"),
+        ("student", "update"), ("assignment", "delete"),
+    ]
+    assert feed["changes"][3]["data"]["name"] == "Feed Renamed"
+    assert feed["changes"][4]["data"] == {"id": a["id"]}
+    assert feed["cursor"] == feed["changes"][-1]["id"]
+    page = client.get(f"/changes?since={cursor}&limit=2").json()
+    assert page["cursor"] == feed["changes"][1]["id"]
+    assert client.get(f"/changes?since={feed['cursor']}").json() == {"cursor": feed["cursor"], "changes": []}
+
+def test_change_stream_backfills_then_follows(client, monkeypatch):
+    monkeypatch.setattr(main.change_hub, "interval", 0.01)
+    cursor = int(client.get("/matrix").headers["X-Change-Cursor"])
+    client.post("/students/", json={"name": "Stream1", "email": "stream1@example.com"})
+
+    async def read_events():
+        events = main._change_events(cursor)
+        try:
+            backfill = await anext(events)
+            client.post("/students/", json={"name": "Stream2", "email": "stream2@example.com"})
+            followed = await asyncio.wait_for(anext(events), 5)
+        finally:
+            await events.aclose()
+        return backfill, followed
+
+    backfill, followed = asyncio.run(read_events())
+    assert "stream1@example.com" in backfill and "stream2@example.com" not in backfill
+    assert followed.startswith("id: ") and "stream2@example.com" in followed
+    assert not main.change_hub._subscribers
+
+def test_submission_analytics_cache(client, monkeypatch):
+    a = client.post("/assignments/", json={"title": "Analytics", "description": "Desc", "due_date": "2099-01-01T00:00:00"}).json()
+    client.post("/assignments/", json={"title": "Analytics2", "description": "Desc", "due_date": "2000-01-01T00:00:00"})
+    s = client.post("/students/", json={"name": "Analyst", "email": "analyst@example.com"}).json()
+    resp = client.get(f"/analytics/submissions/{a['id']}")
+    assert resp.status_code == 200 and resp.json()["total"] == 0
+    assert client.get(f"/analytics/submissions/{a['id']}", headers={"If-None-Match": resp.headers["ETag"]}).status_code == 304
+    client.get("/analytics/submissions")
+    computed = []
+    original = main.crud_async.get_submission_analytics
+    async def recording(db, assignment_ids, bucket):
+        computed.append(list(assignment_ids))
+        return await original(db, assignment_ids, bucket)
+    monkeypatch.setattr(main.crud_async, "get_submission_analytics", recording)
+    client.post(f"/submissions/?student_id={s['id']}&assignment_id={a['id']}")
+    stats = {row["assignment_id"]: row for row in client.get("/analytics/submissions").json()}
+    assert (stats[a["id"]]["total"], stats[a["id"]]["on_time"]) == (1, 1)
+    assert stats[a["id"]]["lead_time_hours"]["p50"] > 0
+    # Only the assignment that was written to is recomputed.
+    assert computed == [[a["id"]]]
+    assert client.get("/analytics/submissions?bucket=week").status_code == 422
+    assert client.get("/analytics/submissions/99999").status_code == 404
+
+def test_compression_negotiation(client):
+    for i in range(20):
+        client.post("/students/", json={"name": f"Gzip {i}", "email": f"gzip{i}@example.com"})
+    resp = client.get("/students/", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["vary"]
+    assert resp.headers["etag"].startswith('W/"')
+    assert any(s["email"] == "gzip0@example.com" for s in resp.json())
+    resp = client.get("/students/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in resp.headers
+    # Small bodies are not worth compressing.
+    assert "content-encoding" not in client.get("/metrics/pool", headers={"Accept-Encoding": "gzip"}).headers
+    if compression.brotli is not None:
+        resp = client.get("/students/", headers={"Accept-Encoding": "gzip, br"})
+        assert resp.headers["content-encoding"] == "br"
+        assert compression.choose_encoding("br;q=0, gzip") == "gzip"
+
+def test_last_modified_conditional_get(client):
+    resp = client.get("/assignments/")
+    last_modified = resp.headers["last-modified"]
+    assert client.get("/assignments/", headers={"If-Modified-Since": last_modified}).status_code == 304
+    # An ETag that does not match wins over If-Modified-Since.
+    assert client.get("/assignments/", headers={"If-Modified-Since": last_modified, "If-None-Match": '"stale"'}).status_code == 200
+
+def test_static_assets_are_fingerprinted(client):
+    page = client.get("/static/index.html")
+    assert page.headers["cache-control"] == "no-cache"
+    script = re.search(r'src="(app\.js\?v=\w+)"', page.text).group(1)
+    assert re.search(r'href="style\.css\?v=\w+"', page.text)
+    assert client.get("/static/index.html", headers={"If-None-Match": page.headers["etag"]}).status_code == 304
+    resp = client.get(f"/static/{script}", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert resp.headers["content-encoding"] == "gzip" and "queueSubmissionToggle" in resp.text
+    assert client.get("/static/app.js?v=old").headers["cache-control"] == "no-cache"
+
+def test_primary_after_write_cookie(client, session_factory, monkeypatch):
+    monkeypatch.setattr(database, "REPLICA_URLS", ["sqlite://"])
+    try:
+        assert "set-cookie" not in client.get("/assignments/").headers
+        resp = client.post("/assignments/", json={"title": "Sticky", "description": "Desc", "due_date": "2025-07-10T12:00:00"})
+        assert resp.headers["set-cookie"].startswith("db_primary=1; Max-Age=")
+        client.cookies.clear()
+        client.get("/assignments/")
+        # Written behind the cache's back: only a request that skips the
+        # cache can see it.
+        with session_factory() as db:
+            db.add(models.Assignment(title="Unseen", description="Desc", due_date=datetime(2025, 7, 10)))
+            db.commit()
+        assert not any(a["title"] == "Unseen" for a in client.get("/assignments/").json())
+        client.cookies.set("db_primary", "1")
+        assert any(a["title"] == "Unseen" for a in client.get("/assignments/").json())
+    finally:
+        client.cookies.clear()
+
+def test_analytics_reads_primary_after_write(client, session_factory, monkeypatch):
+    monkeypatch.setattr(database, "REPLICA_URLS", ["sqlite://"])
+    try:
+        a = client.post("/assignments/", json={"title": "Fresh stats", "description": "Desc", "due_date": "2099-01-01T00:00:00"}).json()
+        s = client.post("/students/", json={"name": "Fresh", "email": "fresh@example.com"}).json()
+        client.cookies.clear()
+        assert client.get(f"/analytics/submissions/{a['id']}").json()["total"] == 0
+        with session_factory() as db:
+            db.add(models.Submission(student_id=s["id"], assignment_id=a["id"]))
+            db.commit()
+        assert client.get(f"/analytics/submissions/{a['id']}").json()["total"] == 0
+        client.cookies.set("db_primary", "1")
+        assert client.get(f"/analytics/submissions/{a['id']}").json()["total"] == 1
+        stats = {row["assignment_id"]: row for row in client.get("/analytics/submissions").json()}
+        assert stats[a["id"]]["total"] == 1
+    finally:
+        client.cookies.clear()
+
+def test_import_creates_no_engine():
+    env = {name: value for name, value in os.environ.items() if name != "DATABASE_URL"}
+    code = "import app.main, app.database as d; assert 'engine' not in vars(d) and d.DATABASE_URL is None and 'psycopg2' not in __import__('sys').modules"
+    subprocess.run([sys.executable, "-c", code], cwd=os.path.join(os.path.dirname(__file__), ".."), env=env, check=True)
+
+def test_single_flight_coalesces_concurrent_calls():
+    calls = []
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+    async def run():
+        flight = cache.SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", slow) for _ in range(5)))
+        # Once the first call finishes, the next one runs again.
+        return results, await flight.do("k", slow)
+    results, again = asyncio.run(run())
+    assert results == [1] * 5 and again == 2
+
+def test_token_bucket_limiter():
+    limiter = ratelimit.TokenBucketLimiter(max_buckets=2)
+    assert [limiter.acquire("a", 1, 2, now=0) for _ in range(3)] == [0, 0, 1]
+    assert limiter.acquire("a", 1, 2, now=0.5) == 0.5
+    assert limiter.acquire("a", 1, 2, now=1.5) == 0
+    limiter.acquire("b", 1, 2, now=2)
+    limiter.acquire("c", 1, 2, now=2)
+    assert "a" not in limiter._buckets
+
+def test_rate_limited_route(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", ratelimit.TokenBucketLimiter())
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_SCALE", 0.02)
+    assert client.get("/assignments/").status_code == 200
+    resp = client.get("/assignments/")
+    assert resp.status_code == 429 and int(resp.headers["retry-after"]) >= 1
+    # Buckets are per route.
+    assert client.get("/students/").status_code == 200
+
+def test_paging_past_the_burst(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", ratelimit.TokenBucketLimiter())
+    for i in range(25):
+        client.post("/students/", json={"name": f"Pager {i}", "email": f"pager{i}@example.com"})
+    burst = main.RATE_LIMITS["matrix"][1]
+    pages, after = 0, None
+    while True:
+        resp = client.get("/matrix?limit=1" + ("" if after is None else f"&after={after}"))
+        assert resp.status_code == 200, f"page {pages + 1}: {resp.status_code}"
+        pages += 1
+        students = resp.json()["students"]
+        if not students:
+            break
+        after = students[-1]["id"]
+    assert pages > burst
+    # Fresh reads of the first page still have the route's own limit.
+    statuses = [client.get("/matrix?limit=1").status_code for _ in range(burst + 1)]
+    assert statuses.count(429) >= 1
+    # after without limit is no continuation page.
+    assert client.get("/matrix?after=0").status_code == 429
+
+def test_unpaged_routes_ignore_after(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", ratelimit.TokenBucketLimiter())
+    burst = main.RATE_LIMITS["analytics"][1]
+    statuses = [client.get(f"/analytics/submissions?after={i}&limit=1").status_code for i in range(burst + 1)]
+    assert statuses[-1] == 429
+
+def test_async_startup_releases_sync_pool(tmp_path):
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'pool.db'}", "DB_ASYNC": "1"}
+    code = (
+        "from fastapi.testclient import TestClient\n"
+        "from app import database, main\n"
+        "with TestClient(main.app):\n"
+        "    assert database.engine.pool.checkedin() == 0, database.engine.pool.status()\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=os.path.join(os.path.dirname(__file__), ".."), env=env, check=True)
+
+def test_init_db_creates_indexes_on_existing_tables(client, engine, capsys):
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_submissions_assignment_submitted"))
+    manage.main(["init-db"])
+    assert "ix_submissions_assignment_submitted" in {index["name"] for index in inspect(engine).get_indexes("submissions")}
+    assert "indexes" in capsys.readouterr().out
+
+def test_serve_sets_up_schema_and_cache_once(monkeypatch, capsys):
+    uvicorn = pytest.importorskip("uvicorn")
+    monkeypatch.setenv("CACHE_TTL", "60")
+    monkeypatch.setenv("DB_CREATE_SCHEMA", "1")
+    monkeypatch.delenv("CACHE_URL", raising=False)
+    started = []
+    monkeypatch.setattr(uvicorn, "run", lambda *args, **kwargs: started.append((os.environ["CACHE_TTL"], os.environ["DB_CREATE_SCHEMA"], kwargs["workers"])))
+    manage.main(["serve", "--workers", "2", "--max-connections", "0"])
+    # The workers neither cache on their own nor race to create the schema.
+    assert started == [("0", "0", 2)]
+    assert "indexes" in capsys.readouterr().out